@@ -12,17 +12,26 @@ from src.utils.files import (
     load_from_json,
     load_to_json,
     ensure_dir,
-    db_to_json,
+    export_memory_segment,
+    compaction_due,
+    compact_memory_segments,
+    get_file_hashmap,
+    MEMORY_SEGMENTS_DIR,
 )
+from src.utils.database import MemoryStore, MemoryWriter
+from src.utils.compaction import compact_memory, get_summarizer
+from src.utils.location import configure_self_location, SELF_LOCATION_TTL
 from src.utils.cli import green_text, red_text, yellow_text
 from src.ais.assistant import (
     load_or_create_assistant,
     upload_instruction,
     upload_file_by_name,
+    remove_file,
     get_thread,
     create_thread,
     run_thread_message,
 )
+from src.ais.functions.azure import get_outbox, graph_byte_counters
 
 
 class Assistant:
@@ -41,11 +50,17 @@ class Assistant:
             The Assistant ID
         name: str
             The name of the Assistant
+        memory: MemoryStore
+            The conversation memory store
+        memory_writer: MemoryWriter
+            The write-behind buffer in front of the memory store
 
     Methods
     -------
         init_from_dir(recreate: bool = False)
             Initialize an agent from a directory
+        sync_memory()
+            Export and upload the memory written since the last start
         upload_instructions()
             Upload the instructions file to the assignment
         upload_files(recreate: bool)
@@ -54,6 +69,8 @@ class Assistant:
             Load a conversation from the conv.json file, or create one if it doesn't exist
         chat(conv: dict, msg: str)
             Chat with the Assistant
+        close()
+            Flush pending memory writes and close the memory store
         data_dir()
             Get the path to the data directory
         data_files_dir()
@@ -99,15 +116,28 @@ class Assistant:
         self.asst_id = await load_or_create_assistant(self.oac, self.config, recreate)
         self.name = self.config["name"]
 
-        db_to_json()
+        # Resume delivery of emails queued before the last shutdown
+        get_outbox().start()
+
+        # Resolved in the background, so the first weather question doesn't wait for it
+        location_config = self.config.get("location", {})
+        configure_self_location(
+            location_config.get("place"),
+            location_config.get("ttl_hours", SELF_LOCATION_TTL / 3600) * 3600,
+        ).prefetch()
+
+        # Opened after load_or_create_assistant, which may wipe the database
+        memory_config = self.config.get("memory", {})
+        self.memory = MemoryStore(synchronous=memory_config.get("synchronous", "NORMAL"))
+        self.memory_writer = MemoryWriter(
+            self.memory,
+            batch_size=memory_config.get("batch_size", 32),
+            flush_interval=memory_config.get("flush_interval_ms", 250) / 1000,
+            max_queue=memory_config.get("max_queue", 1024),
+        )
 
         try:
-            await upload_file_by_name(
-                self.oac,
-                asst_id=self.asst_id,
-                filename=Path(r"app\agent\.agent\persistance\memory.json"),
-                force=True,
-            )
+            await self.sync_memory()
         except Exception as e:
             yellow_text(str(e))
             yellow_text("\nNo previous memory\n")
@@ -117,6 +147,75 @@ class Assistant:
 
         return self
 
+    async def sync_memory(self) -> int:
+        """
+        The sync_memory function exports the memory written since the last start as a new segment,
+        then rolls memory older than the retention policy into summaries, compacts the segments
+        when due, and uploads only the segments not uploaded yet.
+
+        Parameters
+        ----------
+            self: Assistant
+                Refer to the object that is calling the method
+
+        Returns
+        -------
+
+            The number of segments uploaded
+        """
+        memory_config = self.config.get("memory", {})
+        segments_dir = Path(MEMORY_SEGMENTS_DIR)
+
+        # Memory used to be uploaded whole as memory.json; the segments replace it
+        if self.memory.get_state("legacy_json_removed") is None:
+            file_hashmap = await get_file_hashmap(self.oac, self.asst_id)
+            if "memory.json" in file_hashmap:
+                await remove_file(self.oac, self.asst_id, file_hashmap["memory.json"])
+            self.memory.set_state("legacy_json_removed", "1")
+
+        # Raw turns are exported before they can be rolled into summaries, so a segment keeps them
+        export_memory_segment(self.memory, segments_dir)
+
+        retention = memory_config.get("retention", {})
+        if retention.get("raw_days"):
+            compacted = await asyncio.to_thread(
+                compact_memory,
+                self.memory,
+                retention["raw_days"],
+                retention.get("group_by", "day"),
+                get_summarizer(retention.get("summarizer", "extractive")),
+                retention.get("summary_days", 0),
+            )
+            if compacted:
+                green_text(f"Compacted {compacted} memory rows into summaries")
+
+        if compaction_due(
+            self.memory,
+            memory_config.get("compact_after_segments", 16),
+            memory_config.get("compaction_interval_days", 7),
+        ):
+            _, replaced = compact_memory_segments(self.memory, segments_dir)
+
+            for segment in replaced:
+                if segment["file_id"]:
+                    await remove_file(self.oac, self.asst_id, segment["file_id"])
+
+        num_uploaded = 0
+
+        for segment in self.memory.segments():
+            if segment["file_id"]:
+                continue
+
+            file_id, uploaded = await upload_file_by_name(
+                self.oac, self.asst_id, segments_dir / segment["name"], False
+            )
+            self.memory.set_segment_file(segment["name"], file_id)
+
+            if uploaded:
+                num_uploaded += 1
+
+        return num_uploaded
+
     async def upload_instructions(self):
         """
         The upload_instructions function uploads the instructions file to the assignment.
@@ -187,16 +286,32 @@ class Assistant:
                     if bundle["bundle_name"] == "source-code":
                         bundle_file_name = f"{self.name}-{bundle['bundle_name']}-{self.asst_id}.{bundle['dst_ext']}"
                         bundle_file = self.data_files_dir().joinpath(bundle_file_name)
-                        force_reupload = recreate or not bundle_file.exists()
+                        max_kb = bundle.get("max_kb")
+
+                        # Only written again, and so uploaded again, when a source changed
+                        try:
+                            shards, changed = bundle_to_file(
+                                files, bundle_file, max_kb * 1024 if max_kb else None
+                            )
+                        except OSError as e:
+                            # An unreadable source skips this bundle, not the whole upload
+                            red_text(f"Failed to bundle '{bundle['bundle_name']}': {e}")
+                            continue
 
-                        bundle_to_file(files, bundle_file)
                         # print(f"\n debug -- bundle_file: {type(bundle_file)}\n")
-                        _, uploaded = await upload_file_by_name(
-                            self.oac, self.asst_id, bundle_file, force_reupload
-                        )
-
-                        if uploaded:
-                            num_uploaded += 1
+                        for shard in shards:
+                            _, uploaded = await upload_file_by_name(
+                                self.oac, self.asst_id, shard, recreate or changed
+                            )
+
+                            if uploaded:
+                                num_uploaded += 1
+
+                        # Shards left over from a previous, differently split bundle
+                        shard_names = {shard.name for shard in shards}
+                        for name, file_id in (await get_file_hashmap(self.oac, self.asst_id)).items():
+                            if name.startswith(bundle_file.stem) and name not in shard_names:
+                                await remove_file(self.oac, self.asst_id, file_id)
                     else:
                         for file in files:
                             if not str(file.name) == "conv.json":
@@ -264,9 +379,40 @@ class Assistant:
 
             A string containing the response from the Assistant
         """
-        res = await run_thread_message(self.oac, self.asst_id, conv["thread_id"], msg)
+        res = await run_thread_message(
+            self.oac, self.asst_id, conv["thread_id"], msg, self.memory_writer
+        )
         return res
 
+    async def close(self):
+        """
+        The close function flushes pending memory writes, closes the memory store
+        and reports the bytes received from Graph per tool during the session.
+
+        Parameters
+        ----------
+            self: Assistant
+                Represent the instance of the class
+
+        Returns
+        -------
+
+            None
+        """
+        if hasattr(self, "memory_writer"):
+            try:
+                await self.memory_writer.close()
+            finally:
+                self.memory.close()
+
+        graph_bytes = graph_byte_counters()
+
+        if graph_bytes:
+            green_text(
+                "Graph bytes received: "
+                + ", ".join(f"{tool} {count}" for tool, count in sorted(graph_bytes.items()))
+            )
+
     def data_dir(self) -> Path:
         """
         The data_dir function returns the path to the data directory, ensuring its existence.
@@ -4,28 +4,41 @@ import json
 import os
 import re
 import base64
+import shutil
 
 from pathlib import Path
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from openai import NotFoundError, OpenAI
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from inspect import signature, Parameter, iscoroutinefunction
 
 from src.ais.msg import get_msg_content, user_msg
-from src.utils.database import write_to_memory
-from src.utils.files import find, get_file_hashmap
+from src.utils.database import MemoryStore, MemoryWriter
+from src.utils.files import find, get_file_hashmap, MEMORY_SEGMENTS_DIR
 from src.utils.cli import red_text, green_text, yellow_text
+from src.utils.file_registry import get_file_registry, sha256_file
+from src.utils.images import (
+    get_vision_cache,
+    prepare_image,
+    VISION_MAX_IMAGES,
+    VISION_MAX_PAYLOAD,
+    VISION_WORKERS,
+)
 
 from src.ais.functions.azure import (
     getCalendar,
     readEmail,
     writeEmail,
     sendEmail,
+    getOutboxStatus,
     createCalendarEvent,
     saveCalendarEvent,
     getContacts,
 )
 from src.ais.functions.misc import getWeather, getLocation, getDate
 from src.ais.functions.office import findFile
+from src.ais.functions.memory import recallMemory
 from src.ais.functions.web import webViewer, webQuery, dataQuery
 
 
@@ -118,6 +131,8 @@ async def delete(client, asst_id: str, wipe=True):
             green_text(f"File '{file_id}' removed")
             # print(f"File '{file_id}' deleted")
 
+    get_file_registry().forget_assistant(asst_id)
+
     for key in file_hashmap.keys():
         path = find(key, r"app/agent")
         if path:
@@ -135,7 +150,17 @@ async def delete(client, asst_id: str, wipe=True):
     try:
         if wipe:
             if os.path.exists(find("memory.db", r"app/agent")):
-                os.remove(find("memory.db", r"app/agent"))
+                db_path = find("memory.db", r"app/agent")
+                os.remove(db_path)
+                # WAL mode keeps the log and shared memory next to the database
+                for suffix in ["-wal", "-shm"]:
+                    if os.path.exists(db_path + suffix):
+                        os.remove(db_path + suffix)
+                # The local vector index is derived from the database
+                for vec_path in [os.path.splitext(db_path)[0] + ext for ext in [".vec", ".vec.ids"]]:
+                    if os.path.exists(vec_path):
+                        os.remove(vec_path)
+                shutil.rmtree(MEMORY_SEGMENTS_DIR, ignore_errors=True)
                 green_text("Memory wiped")
     except:
         red_text("Failed to wipe memory")
@@ -157,7 +182,9 @@ async def get_thread(client, thread_id: str):
     return res
 
 
-async def run_thread_message(client, asst_id: str, thread_id: str, message: str):
+async def run_thread_message(
+    client, asst_id: str, thread_id: str, message: str, memory: MemoryWriter
+):
 
     msg = user_msg(message)
 
@@ -228,7 +255,7 @@ async def run_thread_message(client, asst_id: str, thread_id: str, message: str)
 
             raise e
 
-    write_to_memory("User", message)
+    await memory.write("User", message, thread_id, asst_id)
 
     with Progress(
         SpinnerColumn(), TextColumn("[bold cyan]{task.description}"), transient=True
@@ -244,7 +271,7 @@ async def run_thread_message(client, asst_id: str, thread_id: str, message: str)
             if run.status in ["Completed", "completed"]:
                 progress.stop()
                 print()
-                return await get_thread_message(client, thread_id)
+                return await get_thread_message(client, thread_id, memory, asst_id)
 
             elif run.status in [
                 "Queued",
@@ -264,7 +291,7 @@ async def run_thread_message(client, asst_id: str, thread_id: str, message: str)
                 "RequiresAction",
             ]:
                 await call_required_function(
-                    asst_id, client, thread_id, run.id, run.required_action
+                    asst_id, client, thread_id, run.id, run.required_action, memory.store
                 )
 
             else:
@@ -278,10 +305,8 @@ async def run_thread_message(client, asst_id: str, thread_id: str, message: str)
 
 
 async def call_required_function(
-    asst_id, client, thread_id: str, run_id: str, required_action
+    asst_id, client, thread_id: str, run_id: str, required_action, memory: MemoryStore
 ):
-    tool_outputs = []
-
     # Function mapping
     function_map = {
         "getWeather": getWeather,
@@ -289,6 +314,7 @@ async def call_required_function(
         "readEmail": readEmail,
         "writeEmail": writeEmail,
         "sendEmail": sendEmail,
+        "getOutboxStatus": getOutboxStatus,
         "getLocation": getLocation,
         "getDate": getDate,
         "createCalendarEvent": createCalendarEvent,
@@ -299,14 +325,20 @@ async def call_required_function(
         "webQuery": webQuery,
         "dataQuery": dataQuery,
         "vision": vision,
+        "recallMemory": recallMemory,
     }
 
+    # Arguments supplied by the assistant rather than by the model
+    injected_args = {"client", "asst_id", "memory"}
+
     def filter_args(func, provided_args):
         sig = signature(func)
         filtered_args = {}
         missing_args = []
 
         for name, param in sig.parameters.items():
+            if name in injected_args:
+                continue
             if param.default == Parameter.empty:  # This is a required parameter
                 if name not in provided_args:
                     missing_args.append(name)
@@ -322,30 +354,46 @@ async def call_required_function(
 
         return filtered_args
 
+    async def run_tool_call(tool_call):
+        func_name = tool_call.function.name
+        args = json.loads(tool_call.function.arguments)
+
+        if func_name not in function_map:
+            raise ValueError(f"Function '{func_name}' not found")
+
+        func = function_map[func_name]
+        filtered_args = filter_args(func, args)
+
+        if iscoroutinefunction(func):
+            if func_name in ["findFile", "vision"]:
+                outputs = await func(client, asst_id, **filtered_args)
+            else:
+                outputs = await func(**filtered_args)
+        elif func_name in ["recallMemory"]:
+            outputs = await asyncio.to_thread(func, memory, **filtered_args)
+        else:
+            # Sync tools run in worker threads so calls issued in the same step
+            # overlap, which lets the Graph batcher group them into one request
+            outputs = await asyncio.to_thread(func, **filtered_args)
+
+        return {"tool_call_id": tool_call.id, "output": outputs}
+
+    tool_calls = []
+
     for action in required_action:
         if not isinstance(action[1], str):
-            func_name = action[1].tool_calls[0].function.name
-            args = json.loads(action[1].tool_calls[0].function.arguments)
-
-            if func_name in function_map:
-                func = function_map[func_name]
-                filtered_args = filter_args(func, args)
-
-                # Check if args were successfully filtered and function exists
-                if filtered_args is not None:
-                    if iscoroutinefunction(func):
-                        if func_name in ["findFile", "vision"]:
-                            outputs = await func(client, asst_id, **filtered_args)
-                        else:
-                            outputs = await func(**filtered_args)
-                    else:
-                        outputs = func(**filtered_args)
-
-                    tool_outputs.append(
-                        {"tool_call_id": action[1].tool_calls[0].id, "output": outputs}
-                    )
-            else:
-                raise ValueError(f"Function '{func_name}' not found")
+            tool_calls.extend(action[1].tool_calls)
+
+    async def safe_tool_call(tool_call):
+        # A failing tool answers with its error, so the other outputs are still
+        # submitted and the run doesn't stay in requires_action
+        try:
+            return await run_tool_call(tool_call)
+        except Exception as e:
+            red_text(f"Tool '{tool_call.function.name}' failed: {e}")
+            return {"tool_call_id": tool_call.id, "output": f"Error: {e}"}
+
+    tool_outputs = list(await asyncio.gather(*(safe_tool_call(tc) for tc in tool_calls)))
 
     # Encode bytes output to Base64 string if necessary
     for tool_output in tool_outputs:
@@ -364,7 +412,9 @@ async def call_required_function(
     )
 
 
-async def get_thread_message(client, thread_id: str):
+async def get_thread_message(
+    client, thread_id: str, memory: MemoryWriter, asst_id: Optional[str] = None
+):
     threads = client.beta.threads
 
     try:
@@ -382,9 +432,11 @@ async def get_thread_message(client, thread_id: str):
         txt = get_msg_content(client, msg)
 
         if isinstance(txt, str):
-            write_to_memory("Assistant", txt)
+            await memory.write("Assistant", txt, thread_id, asst_id)
         else:
-            write_to_memory("Assistant", "File received from Assistant")
+            await memory.write(
+                "Assistant", "File received from Assistant", thread_id, asst_id
+            )
 
         return txt
 
@@ -406,7 +458,23 @@ async def upload_file_by_name(client, asst_id: str, filename: Path, force: bool
             yellow_text(f"File '{filename}' already uploaded")
             return file_id, False
 
+        # The same content received under another name, e.g. a webapp upload linked into
+        # the documents directory, is recorded as an alias instead of being uploaded again
+        registry = get_file_registry()
+        remote_ids = set(file_id_by_name.values())
+
+        known = registry.by_name(asst_id, filename.name)
+        if known is None or known["file_id"] not in remote_ids:
+            known = registry.by_hash(asst_id, sha256_file(filename))
+
+        if known is not None and known["file_id"] in remote_ids:
+            registry.add_alias(asst_id, filename.name, known["file_id"])
+            yellow_text(f"File '{filename}' already uploaded")
+            return known["file_id"], False
+
     if file_id:
+        get_file_registry().remove(file_id)
+
         try:
             assistant_files.delete(assistant_id=asst_id, file_id=file_id)
 
@@ -443,6 +511,7 @@ async def upload_file_by_name(client, asst_id: str, filename: Path, force: bool
             assistant_id=asst_id,
             file_id=uploaded_file.id,
         )
+        get_file_registry().record(asst_id, uploaded_file.id, filename)
 
         green_text(f"File '{filename}' uploaded")
         # print(f"File '{filename}' uploaded")
@@ -457,45 +526,102 @@ async def upload_file_by_name(client, asst_id: str, filename: Path, force: bool
         return None, False
 
 
-async def vision(client, asst_id: str, file_id: str, query: str) -> str:
-    # print("\n--debug: called vision function with parameters: \n", file_id, query)
-    file_id_by_name = await get_file_hashmap(client, asst_id)
+async def remove_file(client, asst_id: str, file_id: str):
+    get_file_registry().remove(file_id)
+
+    try:
+        client.beta.assistants.files.delete(assistant_id=asst_id, file_id=file_id)
+    except Exception as e:
+        yellow_text(f"Couldn't detach file '{file_id}' from the assistant: {e}")
+
+    try:
+        client.files.delete(file_id)
+        green_text(f"File '{file_id}' removed")
+    except Exception as e:
+        red_text(f"Couldn't remove file '{file_id}': {e}")
 
-    file_name = next(
-        (name for name, id in file_id_by_name.items() if id == file_id), None
-    )
 
-    # print(f"\n--debug: File name: {file_name}\n")
+async def _image_paths(client, asst_id: str, file_ids: list[str]) -> list[Optional[str]]:
+    # Resolved from the registry, with a single listing of the assistant's files for the rest
+    registry = get_file_registry()
+    entries = [registry.by_id(file_id) for file_id in file_ids]
+    paths = [
+        entry["path"] if entry is not None and entry["path"] and os.path.exists(entry["path"]) else None
+        for entry in entries
+    ]
 
-    image_path = find(file_name, r"app/files")
+    if all(paths):
+        return paths
 
-    # print(f"\n--debug: Image path: {image_path}\n")
+    name_by_id = {id: name for name, id in (await get_file_hashmap(client, asst_id)).items()}
 
-    with open(image_path, "rb") as image_file:
-        image_url_base64 = base64.b64encode(image_file.read()).decode("utf-8")
+    # print(f"\n--debug: File names: {name_by_id}\n")
 
-    image_url = f"data:image/jpeg;base64,{image_url_base64}"
+    return [
+        path or (find(name_by_id[file_id], r"app/files") if file_id in name_by_id else None)
+        for file_id, path in zip(file_ids, paths)
+    ]
 
-    # print(f"\n--debug: Image URL: {image_url[10:]}\n")
 
+def _vision_groups(image_urls: list[str]) -> list[list[int]]:
+    # Greedy split, keeping the images in order, under both per-request limits
+    groups, size = [[]], 0
+
+    for i, image_url in enumerate(image_urls):
+        if groups[-1] and (
+            len(groups[-1]) >= VISION_MAX_IMAGES or size + len(image_url) > VISION_MAX_PAYLOAD
+        ):
+            groups.append([])
+            size = 0
+
+        groups[-1].append(i)
+        size += len(image_url)
+
+    return groups
+
+
+def _merge_answers(client, query: str, partial_answers: list[str]) -> str:
+    # Text only: the answers about each group of images are combined into one answer,
+    # so the query can still compare images that were sent in different requests
     chat_completion = client.chat.completions.create(
         messages=[
             {
-                "role": "system", 
-                    "content": [
-                        {"type": "text", "text": "You are an expert at describing images, be as descriptive as possible. Format your answer in a way that is easily digestible for a LLM."}
-                    ],
-
+                "role": "system",
+                "content": [
+                    {"type": "text", "text": "You combine descriptions of labelled images, written separately for groups of images, into a single answer to the query. Refer to the images by their labels. Format your answer in a way that is easily digestible for a LLM."}
+                ],
+            },
+            {
                 "role": "user",
-                    "content": [
-                        {"type": "text", "text": query},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": image_url, "detail": "high"},
-                        },
-                    ],
+                "content": [{"type": "text", "text": "\n\n".join([f"Query: {query}"] + partial_answers)}],
+            },
+        ],
+        model="gpt-4-turbo-2024-04-09",
+    )
+
+    return chat_completion.choices[0].message.content
+
 
+def _describe_images(
+    client, labels: list[Optional[str]], image_urls: list[str], query: str, detail: str
+) -> str:
+    content = [{"type": "text", "text": query}]
+
+    for label, image_url in zip(labels, image_urls):
+        # Each image follows its label, so the answer can refer to the images by name
+        if label:
+            content.append({"type": "text", "text": label})
+        content.append({"type": "image_url", "image_url": {"url": image_url, "detail": detail}})
+
+    chat_completion = client.chat.completions.create(
+        messages=[
+            {
+                "role": "system",
+                "content": [
+                    {"type": "text", "text": "You are an expert at describing images, be as descriptive as possible. Format your answer in a way that is easily digestible for a LLM."}
+                ],
             },
+            {"role": "user", "content": content},
         ],
         model="gpt-4-turbo-2024-04-09",
     )
@@ -503,3 +629,108 @@ async def vision(client, asst_id: str, file_id: str, query: str) -> str:
     # print(f"\n--debug: Chat completion: {chat_completion.choices[0].message.content}\n")
 
     return chat_completion.choices[0].message.content
+
+
+async def vision(
+    client,
+    asst_id: str,
+    query: str,
+    file_id: Optional[str] = None,
+    file_ids: Optional[list[str]] = None,
+    detail: str = "high",
+) -> str:
+    """
+    The vision function answers a query about one or several uploaded images. The images are
+    downsized, concurrently, to the resolution the model uses for `detail`, then sent with
+    a label each in as few requests as the payload limits allow. When they had to be split,
+    the requests run concurrently and their labelled answers are merged by a final text-only
+    request. Answers are cached per images content, query and detail.
+
+    Parameters
+    ----------
+        client
+            The OpenAI client
+        asst_id: str
+            The id of the assistant the images were uploaded to
+        query: str
+            What to look for in the images
+        file_id: Optional[str]
+            The id of an uploaded image
+        file_ids: Optional[list[str]]
+            The ids of uploaded images, to be looked at together
+        detail: str
+            'high' or 'low', the detail level the model looks at the images with
+
+    Returns
+    -------
+
+        The answer of the vision model
+    """
+    # print("\n--debug: called vision function with parameters: \n", file_id, file_ids, query)
+    file_ids = list(dict.fromkeys((file_ids or []) + ([file_id] if file_id else [])))
+    if not file_ids:
+        return "No image given; pass a file_id or file_ids"
+
+    image_paths = await _image_paths(client, asst_id, file_ids)
+
+    missing = [fid for fid, path in zip(file_ids, image_paths) if path is None]
+    if missing:
+        return f"Image(s) not found: {', '.join(missing)}"
+
+    # print(f"\n--debug: Image paths: {image_paths}\n")
+
+    cache = get_vision_cache()
+    labels = [
+        f"Image {i + 1}: {Path(path).name}" if len(image_paths) > 1 else None
+        for i, path in enumerate(image_paths)
+    ]
+
+    with ThreadPoolExecutor(max_workers=min(VISION_WORKERS, len(image_paths))) as pool:
+        hashes = await asyncio.gather(
+            *(asyncio.get_running_loop().run_in_executor(pool, sha256_file, path) for path in image_paths)
+        )
+
+        # A set of images is cached under the hashes of its images, in order
+        cached = cache.get("+".join(hashes), query, detail)
+        if cached is not None:
+            return cached
+
+        image_urls = await asyncio.gather(
+            *(
+                asyncio.get_running_loop().run_in_executor(pool, prepare_image, path, detail)
+                for path in image_paths
+            )
+        )
+
+    groups = _vision_groups(image_urls)
+
+    answers = await asyncio.gather(
+        *(
+            asyncio.to_thread(
+                _describe_images,
+                client,
+                [labels[i] for i in group],
+                [image_urls[i] for i in group],
+                query,
+                detail,
+            )
+            for group in groups
+        )
+    )
+
+    if len(answers) == 1:
+        description = answers[0]
+    else:
+        description = await asyncio.to_thread(
+            _merge_answers,
+            client,
+            query,
+            [
+                f"{', '.join(labels[i] for i in group)}\n{answer}"
+                for group, answer in zip(groups, answers)
+            ],
+        )
+
+    cache.put("+".join(hashes), query, detail, description)
+
+    return description
@@ -1,7 +1,13 @@
 import os
+import json
+import base64
+import threading
+import requests
 import dateparser
 
-from typing import Optional, Tuple
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, Tuple
 from datetime import datetime, timedelta
 from fuzzywuzzy import fuzz
 from O365 import Account, MSGraphProtocol
@@ -9,10 +15,54 @@ from O365.utils import Query
 
 from src.utils.files import find
 from src.utils.tools import get_context, html_to_text
+from src.utils.calendar_index import CalendarIndex, insort_event, to_local_naive
+from src.utils.outbox import DeliveryRejected, Outbox
 from typing import cast
 
 SCOPES = ["basic", "message_all", "calendar_all", "address_book_all", "tasks_all"]
 
+CALENDAR_INDEX_TTL = 300  # seconds
+CALENDAR_INDEX_MARGIN = timedelta(days=2)
+CALENDAR_PAGE_LIMIT = 25  # events listed by getCalendar
+
+GRAPH_BATCH_LIMIT = 20  # Graph JSON batching accepts at most 20 requests per batch
+GRAPH_BATCH_WINDOW = float(os.environ.get("GRAPH_BATCH_WINDOW_MS", "50")) / 1000
+GRAPH_BATCH_URL = os.environ.get("GRAPH_BATCH_URL")  # e.g. a local stand-in server
+GRAPH_REQUEST_LIMIT = 4 * 1024 * 1024  # Graph rejects request bodies above 4 MB
+GRAPH_BATCH_BYTES = 3 * 1024 * 1024  # bodies per batch, leaving room for the batch envelope
+
+# Graph rejects inline attachments above 3 MB; larger ones go through upload sessions
+INLINE_ATTACHMENT_LIMIT = 3 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 12 * 320 * 1024  # chunks must be multiples of 320 KiB and under 4 MB
+UPLOAD_WORKERS = 4
+ATTACHMENT_OVERHEAD = 1024  # bytes of JSON around each inline attachment
+
+# Fields each tool actually reads, requested with $select
+GRAPH_PROJECTIONS = {
+    # Message.sender is read from 'from'
+    "readEmail": ("subject", "from", "receivedDateTime", "body"),
+    "getCalendar": ("subject", "start", "end", "location", "body"),
+    "calendarIndex": ("subject", "start", "end"),
+    # Contact.full_name is built from givenName and surname
+    "getContacts": ("givenName", "surname", "emailAddresses", "homePhones", "businessPhones"),
+}
+# Rows per page, sent as $top
+GRAPH_PAGE_SIZE = {
+    "readEmail": 5,
+    "getCalendar": 25,
+    "calendarIndex": 50,
+    "getContacts": 50,
+}
+GRAPH_BYTES: defaultdict[str, int] = defaultdict(int)
+
+_graph_tool = threading.local()
+
+_calendar_index: Optional[CalendarIndex] = None
+
+
+# Tools run concurrently in worker threads; only one of them may run the consent flow
+_o365_auth_lock = threading.Lock()
+
 
 def O365Auth(scopes_helper: list[str] = SCOPES) -> Account:
     """
@@ -36,10 +86,11 @@ def O365Auth(scopes_helper: list[str] = SCOPES) -> Account:
     scopes_graph = protocol.get_scopes_for(scopes_helper)
 
     try:
-        account = Account(credentials, protocol=protocol)
+        with _o365_auth_lock:
+            account = Account(credentials, protocol=protocol)
 
-        if not account.is_authenticated:
-            account.authenticate(scopes=scopes_graph)
+            if not account.is_authenticated:
+                account.authenticate(scopes=scopes_graph)
 
         return account
 
@@ -47,6 +98,412 @@ def O365Auth(scopes_helper: list[str] = SCOPES) -> Account:
         raise Exception("Failed to authenticate with O365")
 
 
+class GraphError(Exception):
+    """
+    Raised for a failed Graph request within a batch, with the HTTP status of that request.
+    """
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"Graph request failed ({status}): {message}")
+        self.status = status
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Tells whether a failed Graph call may succeed when retried: throttling (429), request
+    timeouts (408), server errors (5xx) and errors without an HTTP status, such as network errors.
+    """
+    status = getattr(error, "status", None)
+
+    if status is None and isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+
+    return status is None or status in (408, 429) or status >= 500
+
+
+class GraphBatcher:
+    """
+    The GraphBatcher class collects Graph requests issued within a short window and
+    submits them as a single JSON `$batch` request, fanning each response back to its caller.
+
+    Attributes
+    ----------
+        window: float
+            How long, in seconds, to wait for more requests before flushing
+        endpoint: Optional[str]
+            A `$batch` URL to post to directly instead of the authenticated Graph endpoint
+
+    Methods
+    -------
+        submit(method: str, url: str, body: Optional[dict])
+            Queue a request and return a Future for its response
+        request(method: str, url: str, body: Optional[dict])
+            Queue a request and wait for its response body
+        flush()
+            Send the pending requests now
+    """
+
+    def __init__(
+        self, window: float = GRAPH_BATCH_WINDOW, endpoint: Optional[str] = GRAPH_BATCH_URL
+    ) -> None:
+        self.window = window
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+        self._pending: list[tuple[dict, Future, int]] = []
+        self._timer: Optional[threading.Timer] = None
+        self._next_id = 0
+
+    def submit(self, method: str, url: str, body: Optional[dict] = None) -> Future:
+        future: Future = Future()
+
+        with self._lock:
+            self._next_id += 1
+            item = {"id": str(self._next_id), "method": method, "url": url}
+            size = 0
+            if body is not None:
+                item["body"] = body
+                item["headers"] = {"Content-Type": "application/json"}
+                size = len(json.dumps(body))
+
+            self._pending.append((item, future, size))
+
+            if (
+                len(self._pending) >= GRAPH_BATCH_LIMIT
+                or sum(pending[2] for pending in self._pending) >= GRAPH_BATCH_BYTES
+            ):
+                flush_now = True
+            else:
+                flush_now = False
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+        if flush_now:
+            threading.Thread(target=self.flush, daemon=True).start()
+
+        return future
+
+    def request(
+        self, method: str, url: str, body: Optional[dict] = None, timeout: float = 120
+    ) -> dict:
+        return self.submit(method, url, body).result(timeout=timeout)
+
+    def flush(self) -> None:
+        with self._lock:
+            # Up to 20 requests, and only as many bodies as fit under the request size limit
+            count, total = 0, 0
+            for _, _, size in self._pending[:GRAPH_BATCH_LIMIT]:
+                if count and total + size > GRAPH_BATCH_BYTES:
+                    break
+                count, total = count + 1, total + size
+
+            batch = self._pending[:count]
+            self._pending = self._pending[count:]
+
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if self._pending:
+                self._timer = threading.Timer(0, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if not batch:
+            return
+
+        futures = {item["id"]: future for item, future, _ in batch}
+
+        try:
+            responses = self._post({"requests": [item for item, _, _ in batch]})
+
+        except Exception as e:
+            for future in futures.values():
+                future.set_exception(e)
+            return
+
+        for res in responses.get("responses", []):
+            future = futures.pop(str(res.get("id")), None)
+            if future is None:
+                continue
+
+            if res.get("status", 500) >= 400:
+                error = (res.get("body") or {}).get("error", {})
+                future.set_exception(GraphError(res.get("status"), error.get("message", error)))
+            else:
+                future.set_result(res.get("body") or {})
+
+        for future in futures.values():
+            future.set_exception(Exception("No response for request in Graph batch"))
+
+    def _post(self, payload: dict) -> dict:
+        if self.endpoint:
+            response = requests.post(self.endpoint, json=payload)
+            response.raise_for_status()
+            return response.json()
+
+        account = O365Auth(SCOPES)
+        url = f"{account.protocol.service_url}$batch"
+        response = account.con.post(url, data=payload)
+
+        return response.json()
+
+
+def _count_graph_bytes(response, *args, **kwargs):
+    tool = getattr(_graph_tool, "name", None)
+
+    if tool is not None:
+        GRAPH_BYTES[tool] += int(response.headers.get("Content-Length") or len(response.content))
+
+
+def _track_graph_bytes(account: Account) -> None:
+    con = account.con
+
+    if con.session is None:
+        con.session = con.get_session(load_token=True)
+
+    hooks = con.session.hooks["response"]
+    if _count_graph_bytes not in hooks:
+        hooks.append(_count_graph_bytes)
+
+
+def projected_query(tool: str, resource, attribute: Optional[str] = None) -> Query:
+    """
+    The projected_query function creates a query on an O365 resource that only selects the fields the tool uses.
+
+    Parameters
+    ----------
+        tool: str
+            The tool name, a key of GRAPH_PROJECTIONS
+        resource
+            An O365 object exposing new_query, such as a folder, calendar or address book
+        attribute: Optional[str]
+            The attribute to start filtering on
+
+    Returns
+    -------
+
+        The O365 Query with the tool's $select applied
+    """
+    return resource.new_query(attribute).select(*GRAPH_PROJECTIONS[tool])
+
+
+def iter_graph(
+    tool: str,
+    account: Account,
+    fetch: Callable,
+    query: Query,
+    limit: Optional[int] = None,
+    **kwargs,
+) -> Iterator:
+    """
+    The iter_graph function lazily iterates the results of an O365 fetch method, page by page.
+    Pages hold GRAPH_PAGE_SIZE[tool] rows, and the bytes received are added to GRAPH_BYTES[tool].
+
+    Parameters
+    ----------
+        tool: str
+            The tool name, used for the page size and the byte counter
+        account: Account
+            The authenticated O365 account the fetch goes through
+        fetch: Callable
+            The O365 method to call, such as get_messages, get_events or get_contacts
+        query: Query
+            The query to pass to the fetch method
+        limit: Optional[int]
+            The maximum number of rows, or None for all of them
+
+    Returns
+    -------
+
+        An iterator over the fetched objects
+    """
+    _track_graph_bytes(account)
+    _graph_tool.name = tool
+
+    try:
+        yield from fetch(limit=limit, query=query, batch=GRAPH_PAGE_SIZE[tool], **kwargs)
+
+    finally:
+        _graph_tool.name = None
+
+
+def graph_byte_counters() -> dict[str, int]:
+    """
+    Returns the number of bytes received from Graph per tool since startup.
+    """
+    return dict(GRAPH_BYTES)
+
+
+_graph_batcher: Optional[GraphBatcher] = None
+
+
+def get_graph_batcher() -> GraphBatcher:
+    global _graph_batcher
+
+    if _graph_batcher is None:
+        _graph_batcher = GraphBatcher()
+
+    return _graph_batcher
+
+
+def _store_calendar_index(events, window_start: datetime, window_end: datetime) -> CalendarIndex:
+    global _calendar_index
+
+    _calendar_index = CalendarIndex(
+        ((event.start, event.end, event.subject) for event in events),
+        to_local_naive(window_start),
+        to_local_naive(window_end),
+    )
+
+    return _calendar_index
+
+
+def cached_calendar_index(start: datetime, end: datetime) -> Optional[CalendarIndex]:
+    """
+    Returns the cached calendar index if it is fresh and covers the given range, without
+    authenticating or calling Graph; None otherwise.
+    """
+    start, end = to_local_naive(start), to_local_naive(end)
+
+    if (
+        _calendar_index is not None
+        and not _calendar_index.is_stale(CALENDAR_INDEX_TTL)
+        and _calendar_index.covers(start, end)
+    ):
+        return _calendar_index
+
+    return None
+
+
+def calendar_query(tool: str, calendar, start: datetime, end: datetime) -> Query:
+    """
+    The calendar_query function creates a query for the events between start and end.
+    With include_recurring, O365 turns the start and end filters into a calendar view range,
+    which returns the events overlapping it, including those already in progress.
+    A new query is needed for every call, since O365 removes those filters from the query it uses.
+
+    Parameters
+    ----------
+        tool: str
+            The tool whose projection is selected
+        calendar
+            The O365 calendar
+        start: datetime
+            The start of the range
+        end: datetime
+            The end of the range
+
+    Returns
+    -------
+
+        The query
+    """
+    q = projected_query(tool, calendar, "start").greater_equal(start)  # type: ignore
+    q.chain("and").on_attribute("end").less_equal(end)  # type: ignore
+
+    return q
+
+
+def get_calendar_index(account: Account, start: datetime, end: datetime) -> CalendarIndex:
+    """
+    The get_calendar_index function returns a local index of the calendar covering the given range.
+    The cached index is reused while it is fresh and covers the range, otherwise the events
+    around the range are fetched once and indexed.
+
+    Parameters
+    ----------
+        account: Account
+            The authenticated O365 account
+        start: datetime
+            The start of the range that must be covered
+        end: datetime
+            The end of the range that must be covered
+
+    Returns
+    -------
+
+        A CalendarIndex covering the range
+    """
+    start, end = to_local_naive(start), to_local_naive(end)
+
+    index = cached_calendar_index(start, end)
+    if index is not None:
+        return index
+
+    window_start = start - CALENDAR_INDEX_MARGIN
+    window_end = end + CALENDAR_INDEX_MARGIN
+
+    calendar = account.schedule().get_default_calendar()
+
+    # The calendar view lists every event overlapping the window, recurring ones included.
+    # A plain listing would miss those, so there is no fallback: an incomplete index would
+    # report busy time as free.
+    q = calendar_query("calendarIndex", calendar, window_start, window_end)
+    events = list(iter_graph("calendarIndex", account, calendar.get_events, q, include_recurring=True))  # type: ignore
+
+    return _store_calendar_index(events, window_start, window_end)
+
+
+def schedule_report(
+    start: datetime, end: datetime, account: Optional[Account] = None
+) -> str:
+    """
+    The schedule_report function checks a proposed event against the calendar index.
+    It lists the overlapping events and, if there are any, the nearest free slots of the same duration.
+    Without an account, only an already cached index is used and nothing is fetched.
+
+    Parameters
+    ----------
+        start: datetime
+            The start of the proposed event
+        end: datetime
+            The end of the proposed event
+        account: Optional[Account]
+            An authenticated account used to refresh the index, if needed
+
+    Returns
+    -------
+
+        A string describing conflicts and free slots, or an empty string if the slot is free
+    """
+    start, end = to_local_naive(start), to_local_naive(end)
+    fmt = "%d/%m/%Y, %H:%M"
+
+    if account is None:
+        index = cached_calendar_index(start, end)
+        if index is None:
+            return "Conflicts will be checked when the event is saved.\n"
+
+    else:
+        try:
+            index = get_calendar_index(account, start, end)
+        except Exception as e:
+            return f"Conflict check unavailable: {e}\n"
+
+    conflicts = index.overlapping(start, end)
+
+    if not conflicts:
+        return ""
+
+    conflict_str = "\n".join(
+        f"  - {subject} ({ev_start.strftime(fmt)} - {ev_end.strftime(fmt)})"
+        for ev_start, ev_end, subject in conflicts
+    )
+    slots = index.free_slots(start, end - start)
+    slot_str = (
+        "\n".join(
+            f"  - {slot_start.strftime(fmt)} - {slot_end.strftime(fmt)}"
+            for slot_start, slot_end in slots
+        )
+        if slots
+        else "  - None found nearby"
+    )
+
+    return f"Conflicts:\n{conflict_str}\nNearest free slots:\n{slot_str}\n"
+
+
 def writeEmail(
     recipients: list, subject: str, body: str, attachments: Optional[list] = None
 ) -> str:
@@ -85,9 +542,8 @@ def sendEmail(
     recipients: list, subject: str, body: str, attachments: Optional[list] = None
 ) -> str:
     """
-    The sendEmail function is used to send an email using the O365 library.
-        It takes in a list of recipients, subject, body and attachments as parameters.
-        The function returns a string indicating whether or not the email was sent successfully.
+    The sendEmail function queues an email in the persistent outbox and returns immediately.
+        Delivery happens in the background with retries; use getOutboxStatus to follow it.
 
     Parameters
     ----------
@@ -103,29 +559,306 @@ def sendEmail(
     Returns
     -------
 
-        A string indicating whether the email was sent successfully or not
+        A string with the outbox id of the queued email
     """
     print(f"\nDebug--- Called sendEmail with parameters: \n{recipients}, \n{subject}, \n{body}, \n{attachments}\n")
     try:
-        account = O365Auth(SCOPES)
-        m = account.new_message()
-        m.to.add(recipients)
-        m.subject = subject
-        m.body = body
-        m.body_type = "HTML"
+        message_id = get_outbox().enqueue(
+            {
+                "recipients": recipients,
+                "subject": subject,
+                "body": body,
+                "attachments": attachments or [],
+            }
+        )
 
-        if attachments:
+        return f"Email queued for delivery with outbox id '{message_id}'"
 
-            for attachment_path in attachments:
-                path = find(attachment_path, r"files/mail")
-                m.attachments.add(path)
+    except Exception as e:
+        return f"Failed to queue email: {e}"
 
-        m.send()
 
-        return "Email sent successfully"
+def deliver_email(payload: dict, checkpoint: Callable[[dict], None] = lambda payload: None) -> None:
+    """
+    The deliver_email function sends one queued email through the Graph batcher.
+    It is the delivery callback of the outbox and raises on failure so the message is retried;
+    errors a retry can't fix are raised as DeliveryRejected.
+    The email is saved as a draft first and the draft's id is checkpointed, so a retry after a
+    send whose outcome was lost, e.g. a timeout, checks the draft instead of sending again.
 
-    except:
-        return "Failed to send email"
+    Parameters
+    ----------
+        payload: dict
+            The recipients, subject, body and attachments of the email, and the draft id once created
+        checkpoint: Callable[[dict], None]
+            Saves the payload with the progress made so far
+
+    Returns
+    -------
+
+        None
+    """
+    try:
+        _deliver_email(payload, checkpoint)
+
+    except DeliveryRejected:
+        raise
+
+    except Exception as e:
+        if not is_transient(e):
+            raise DeliveryRejected(str(e)) from e
+        raise
+
+
+def _deliver_email(payload: dict, checkpoint: Callable[[dict], None]) -> None:
+    batcher = get_graph_batcher()
+    draft_id = payload.get("draft_id")
+
+    if draft_id:
+        try:
+            draft = batcher.request("GET", f"/me/messages/{draft_id}?$select=isDraft")
+        except GraphError as e:
+            # A sent draft moves to Sent Items under a new id
+            if e.status == 404:
+                return
+            raise
+
+        if not draft.get("isDraft", True):
+            return
+
+        if payload.get("draft_ready"):
+            batcher.request("POST", f"/me/messages/{draft_id}/send")
+            return
+
+        # Its attachments were left half uploaded; start over from a new draft
+        batcher.request("DELETE", f"/me/messages/{draft_id}")
+        del payload["draft_id"]
+        checkpoint(payload)
+
+    account = O365Auth(SCOPES)
+    m = account.new_message()
+    m.to.add(payload["recipients"])
+    m.subject = payload["subject"]
+    m.body = payload["body"]
+    m.body_type = "HTML"
+
+    large_attachments = []
+    # Inline attachments travel base64-encoded in the draft, which must stay under the request limit
+    inline_budget = GRAPH_REQUEST_LIMIT - len(json.dumps(m.to_api_data())) - ATTACHMENT_OVERHEAD
+
+    for attachment_path in payload.get("attachments", []):
+        path = find(attachment_path, r"files/mail")
+        if path is None:
+            raise DeliveryRejected(f"Attachment '{attachment_path}' not found")
+
+        size = os.path.getsize(path)
+        encoded = 4 * ((size + 2) // 3) + ATTACHMENT_OVERHEAD
+
+        if size <= INLINE_ATTACHMENT_LIMIT and encoded <= inline_budget:
+            m.attachments.add(path)
+            inline_budget -= encoded
+        else:
+            large_attachments.append(path)
+
+    data = m.to_api_data()
+
+    # A draft too large to share a batch is posted on its own
+    if len(json.dumps(data)) > GRAPH_BATCH_BYTES:
+        draft = account.con.post(f"{account.protocol.service_url}me/messages", data=data).json()
+    else:
+        draft = batcher.request("POST", "/me/messages", data)
+
+    payload["draft_id"] = draft["id"]
+    checkpoint(payload)
+
+    # Upload sessions only accept the chunks of one file in order, so files upload in parallel
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        list(
+            executor.map(
+                lambda path: attach_file(account, draft["id"], path),
+                large_attachments,
+            )
+        )
+
+    payload["draft_ready"] = True
+    checkpoint(payload)
+
+    batcher.request("POST", f"/me/messages/{draft['id']}/send")
+
+
+def discard_email(payload: dict) -> None:
+    """
+    The discard_email function deletes the draft of an email the outbox gave up on, so
+    failed deliveries don't leave drafts behind. Drafts already sent are left alone.
+
+    Parameters
+    ----------
+        payload: dict
+            The payload of the failed email
+
+    Returns
+    -------
+
+        None
+    """
+    draft_id = payload.get("draft_id")
+    if not draft_id:
+        return
+
+    batcher = get_graph_batcher()
+
+    try:
+        if batcher.request("GET", f"/me/messages/{draft_id}?$select=isDraft").get("isDraft"):
+            batcher.request("DELETE", f"/me/messages/{draft_id}")
+    except Exception as e:
+        print(f"\nDebug--- Failed to discard draft {draft_id}: {e}\n")
+
+
+def attach_file(account: Account, message_id: str, path: str) -> None:
+    """
+    The attach_file function attaches a file to a draft message in a request of its own,
+    or through an upload session when the encoded file doesn't fit in one request.
+
+    Parameters
+    ----------
+        account: Account
+            The authenticated O365 account
+        message_id: str
+            The id of the draft message to attach the file to
+        path: str
+            The path of the file to attach
+
+    Returns
+    -------
+
+        None
+    """
+    size = os.path.getsize(path)
+
+    if size > INLINE_ATTACHMENT_LIMIT or 4 * ((size + 2) // 3) + ATTACHMENT_OVERHEAD > GRAPH_REQUEST_LIMIT:
+        upload_large_attachment(account, message_id, path)
+        return
+
+    with open(path, "rb") as file:
+        content = base64.b64encode(file.read()).decode("ascii")
+
+    account.con.post(
+        f"{account.protocol.service_url}me/messages/{message_id}/attachments",
+        data={
+            "@odata.type": "#microsoft.graph.fileAttachment",
+            "name": os.path.basename(path),
+            "contentBytes": content,
+        },
+    )
+
+
+def upload_large_attachment(account: Account, message_id: str, path: str) -> None:
+    """
+    The upload_large_attachment function streams a file to a draft message through a Graph upload session.
+    The file is read and sent in fixed-size chunks, so memory use is bounded by the chunk size.
+
+    Parameters
+    ----------
+        account: Account
+            The authenticated O365 account
+        message_id: str
+            The id of the draft message to attach the file to
+        path: str
+            The path of the file to upload
+
+    Returns
+    -------
+
+        None
+    """
+    size = os.path.getsize(path)
+    session = account.con.post(
+        f"{account.protocol.service_url}me/messages/{message_id}/attachments/createUploadSession",
+        data={
+            "AttachmentItem": {
+                "attachmentType": "file",
+                "name": os.path.basename(path),
+                "size": size,
+            }
+        },
+    ).json()
+
+    with open(path, "rb") as file:
+        offset = 0
+
+        while offset < size:
+            chunk = file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                raise IOError(f"'{path}' shrank while being uploaded")
+
+            end = offset + len(chunk) - 1
+
+            # The upload URL is pre-authenticated and must not receive the bearer token
+            response = requests.put(
+                session["uploadUrl"],
+                data=chunk,
+                headers={
+                    "Content-Length": str(len(chunk)),
+                    "Content-Range": f"bytes {offset}-{end}/{size}",
+                },
+            )
+            response.raise_for_status()
+
+            offset = end + 1
+
+
+_outbox: Optional[Outbox] = None
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+
+    if _outbox is None:
+        _outbox = Outbox(deliver_email, on_failed=discard_email)
+
+    return _outbox
+
+
+def getOutboxStatus(message_id: Optional[str] = None) -> str:
+    """
+    The getOutboxStatus function reports the delivery state of queued emails.
+
+    Parameters
+    ----------
+        message_id: Optional[str]
+            The outbox id returned by sendEmail; if omitted, the most recent emails are listed
+
+    Returns
+    -------
+
+        A string describing the state of each email
+    """
+    print(f"\nDebug--- Called getOutboxStatus with parameters: {message_id}\n")
+    entries = get_outbox().status(message_id)
+
+    if not entries:
+        return f"No email found with outbox id '{message_id}'" if message_id else "The outbox is empty"
+
+    reports = []
+
+    for entry in entries:
+        payload = json.loads(entry["payload"])
+
+        report = (
+            f"Id: {entry['id']}\n"
+            f"To: {', '.join(payload['recipients'])}\n"
+            f"Subject: {payload['subject']}\n"
+            f"Status: {entry['status']}\n"
+            f"Attempts: {entry['attempts']}\n"
+            f"Queued: {datetime.fromtimestamp(entry['created']).strftime('%d/%m/%Y, %H:%M:%S')}"
+        )
+
+        if entry["last_error"]:
+            report += f"\nLast error: {entry['last_error']}"
+
+        reports.append(report)
+
+    return "\n\n".join(reports)
 
 
 def readEmail() -> str:
@@ -147,7 +880,8 @@ def readEmail() -> str:
     mailbox = account.mailbox()
     inbox = mailbox.inbox_folder()
 
-    messages = inbox.get_messages(limit=5)
+    q = projected_query("readEmail", inbox)
+    messages = iter_graph("readEmail", account, inbox.get_messages, q, limit=5)
 
     email_reports = []
 
@@ -210,14 +944,22 @@ def getCalendar(upto: Optional[str] = None) -> str:
     schedule = account.schedule()
     calendar = schedule.get_default_calendar()
 
-    q = calendar.new_query("start").greater_equal(datetime.now())  # type: ignore
-    q.chain("and").on_attribute("end").less_equal(upto)  # type: ignore
+    now = datetime.now()
+    complete = True
 
     try:
-        events = calendar.get_events(query=q, include_recurring=True)  # type: ignore
+        q = calendar_query("getCalendar", calendar, now, upto)  # type: ignore
+        events = list(iter_graph("getCalendar", account, calendar.get_events, q, CALENDAR_PAGE_LIMIT, include_recurring=True))  # type: ignore
 
     except:
-        events = calendar.get_events(query=q, include_recurring=False)  # type: ignore
+        # Without the calendar view, recurring events and events in progress are missed
+        complete = False
+        q = calendar_query("getCalendar", calendar, now, upto)  # type: ignore
+        events = list(iter_graph("getCalendar", account, calendar.get_events, q, CALENDAR_PAGE_LIMIT, include_recurring=False))  # type: ignore
+
+    # Only a complete listing can vouch for free time
+    if complete and len(events) < CALENDAR_PAGE_LIMIT:
+        _store_calendar_index(events, now, upto)  # type: ignore
 
     cal_reports = []
 
@@ -279,7 +1021,10 @@ def createCalendarEvent(
         else:
             return "Failed to parse start time. Please try again."
     else:
-        start_time_str = datetime.now().strftime("%d/%m/%Y, %H:%M:%S")
+        start_time = datetime.now()
+        start_time_str = start_time.strftime("%d/%m/%Y, %H:%M:%S")
+
+    end_time = None
 
     if end:
         end_time = get_context(end, ["TIME", "DATE"])
@@ -292,9 +1037,8 @@ def createCalendarEvent(
             else:
                 return "Failed to parse end time. Please try again."
         else:
-            end_time_str = (datetime.now() + timedelta(hours=1)).strftime(
-                "%d/%m/%Y, %H:%M:%S"
-            )
+            end_time = datetime.now() + timedelta(hours=1)
+            end_time_str = end_time.strftime("%d/%m/%Y, %H:%M:%S")
     else:
         end_time_str = ""
 
@@ -306,12 +1050,18 @@ def createCalendarEvent(
     location_str = f"Location: {location}" if location else ""
     recurrence_str = f"Recurrence: {recurrence}" if recurrence else ""
 
+    if not end_time or end_time <= start_time:
+        end_time = start_time + timedelta(hours=1)
+
+    schedule_str = schedule_report(start_time, end_time)
+
     calendar_report = (
         f"Subject: {subject}\n"
         f"Body: {body}\n"
         f"{start_end_str}"
         f"{location_str}"
         f"{recurrence_str}"
+        f"{schedule_str}"
     )
 
     return calendar_report
@@ -324,10 +1074,13 @@ def saveCalendarEvent(
     location: Optional[str] = None,
     body: Optional[str] = None,
     recurrence: bool = False,
+    confirm_conflicts: bool = False,
 ) -> str:
-    print(f"Debug--- Called saveCalendarEvent with parameters: {subject}, {start}, {end}, {location}, {body}, {recurrence}")
+    print(f"Debug--- Called saveCalendarEvent with parameters: {subject}, {start}, {end}, {location}, {body}, {recurrence}, {confirm_conflicts}")
     """
     The saveCalendarEvent function is used to save a new event in the user's Outlook calendar.
+    The event is checked against the calendar first; if it overlaps other events, it is only
+    saved once the user confirmed the conflicts.
 
     Parameters
     ----------
@@ -343,20 +1096,19 @@ def saveCalendarEvent(
             Pass in the body of the event
         recurrence: bool
             Determine if the event is a recurring event
+        confirm_conflicts: bool
+            Save the event even if it overlaps other events
 
     Returns
     -------
 
-        A string indicating the event was created successfully
+        A string indicating the event was created successfully, or the conflicts to confirm
     """
     account = O365Auth(SCOPES)
     schedule = account.schedule()
-    calendar = schedule.get_default_calendar()
 
-    if calendar is not None:
-        event = calendar.new_event()
-    else:
-        raise ValueError("Calendar is not available.")
+    # Created against the default calendar without fetching it; saved through the batcher
+    event = schedule.new_event()
 
     start = dateparser.parse(start)  # type: ignore [attr-defined]
 
@@ -370,6 +1122,14 @@ def saveCalendarEvent(
 
     event.subject = subject
 
+    schedule_str = schedule_report(start, end, account)  # type: ignore
+
+    if schedule_str.startswith("Conflicts:") and not confirm_conflicts:
+        return (
+            f"Event not saved, it overlaps other events\n{schedule_str}"
+            "Ask the user to confirm, then call saveCalendarEvent again with confirm_conflicts set to true"
+        )
+
     if body:
         event.body = body
 
@@ -380,7 +1140,13 @@ def saveCalendarEvent(
     #     event.is_all_day = True
     #     event.recurrence = True
 
-    event.save()
+    get_graph_batcher().request("POST", "/me/events", event.to_api_data())
+
+    if _calendar_index is not None:
+        insort_event(_calendar_index, start, end, subject)  # type: ignore
+
+    if schedule_str:
+        return f"Event created successfully\n{schedule_str}"
 
     return "Event created successfully"
 
@@ -404,7 +1170,9 @@ def getContacts(name: Optional[str] = None) -> str:
     print(f"\nDebug--- Called getContacts with parameters: {name}\n")
     threshold = 80
     account = O365Auth(SCOPES)
-    contacts = account.address_book().get_contacts()  # type: ignore [attr-defined]
+    address_book = account.address_book()
+    q = projected_query("getContacts", address_book)
+    contacts = iter_graph("getContacts", account, address_book.get_contacts, q, limit=100)  # type: ignore [attr-defined]
     
     if not name:
         contact_reports = []
@@ -0,0 +1,69 @@
+import dateparser
+
+from datetime import datetime
+from typing import Optional
+
+from src.utils.database import MemoryStore
+from src.utils.vectors import semantic_search
+
+
+def recallMemory(
+    memory: MemoryStore,
+    query: str,
+    limit: int = 5,
+    since: Optional[str] = None,
+    semantic: bool = False,
+) -> str:
+    """
+    The recallMemory function searches past conversations for messages relevant to a query.
+    Results are ranked by relevance and recency, and only the matching snippets are returned.
+    The semantic search uses a local vector index, so it also finds paraphrases without any
+    network call.
+
+    Parameters
+    ----------
+        memory: MemoryStore
+            The conversation memory store
+        query: str
+            What to look for in past conversations
+        limit: int
+            The maximum number of snippets to return
+        since: Optional[str]
+            Only search messages after this time, e.g. 'last month'
+        semantic: bool
+            Search by meaning instead of by keywords
+
+    Returns
+    -------
+
+        A string of matching snippets with their time and author
+    """
+    print(f"\nDebug--- Called recallMemory with parameters: {query}, {limit}, {since}, {semantic}\n")
+    since_ms = None
+
+    if since:
+        since_time = dateparser.parse(since, settings={"PREFER_DATES_FROM": "past"})
+        if since_time is None:
+            return f"Failed to parse '{since}' as a time. Please try again."
+        since_ms = int(since_time.timestamp() * 1000)
+
+    if semantic:
+        results = semantic_search(memory, query, limit=int(limit), since=since_ms)
+    else:
+        results = memory.search(query, limit=int(limit), since=since_ms)
+
+    if not results:
+        return "No matching memories found"
+
+    memory_reports = []
+
+    for result in results:
+        memory_report = (
+            f"Time: {datetime.fromtimestamp(result['time'] / 1000).strftime('%d/%m/%Y, %H:%M:%S')}\n"
+            f"Role: {result['role']}\n"
+            f"Snippet: {result['snippet']}"
+        )
+
+        memory_reports.append(memory_report)
+
+    return "\n\n".join(memory_reports)
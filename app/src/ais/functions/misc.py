@@ -1,18 +1,20 @@
-import geocoder
-
 from geopy.geocoders import Nominatim
 from typing import Optional
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 
 from src.utils.tools import (
     fetch_weather_report,
+    get_forecast,
     get_current_time,
     get_lat_lon_from_location,
     get_context_from_message,
 )
+from src.utils.location import get_self_location
 
 USER_AGENT = "User"
+WEATHER_WORKERS = 4
 
 
 def getDate() -> str:
@@ -36,7 +38,8 @@ def getLocation() -> str:
     """
     The getLocation function uses the geocoder library to get the user's location.
         It then uses that location to find a more specific address using Nominatim,
-        which is a Python wrapper for OpenStreetMap's API.
+        which is a Python wrapper for OpenStreetMap's API. The location is resolved once
+        per session, or set by the AGENT_LOCATION env var or the [location] config.
 
     Parameters
     ----------
@@ -46,34 +49,76 @@ def getLocation() -> str:
 
         The city name and country code
     """
-    g = geocoder.ip("me").city
-    geolocator = Nominatim(user_agent="User")
-    location = geolocator.geocode(g)
-    if location is not None:
-        return location.address  # type: ignore
+    address = get_self_location().get()["address"]
+    if address is not None:
+        return address
     else:
         return "Location not found"
 
 
-def getWeather(location_message: Optional[str] = None) -> str:
+def getWeather(
+    msg: Optional[str] = None,
+    locations: Optional[list[str]] = None,
+    times: Optional[list[str]] = None,
+) -> str:
     """
     Fetches the weather report for a given location. If no location is provided,
     it uses the current IP address to determine the location.
+    With lists of locations and times, every combination is reported in one table;
+    the places are resolved and their forecasts fetched concurrently.
 
     Parameters:
-        location_message (Optional[str]): The location as a string message, if any.
+        msg (Optional[str]): The location and time as a string message, if any.
+        locations (Optional[list[str]]): The places to compare; defaults to the one in msg.
+        times (Optional[list[str]]): The times to compare; defaults to the one in msg.
 
     Returns:
         str: A weather report for the specified or derived location.
     """
-    print("\n--debug: called getWeather()\n")
+    print(f"\n--debug: called getWeather({msg}, {locations}, {times})\n")
     geolocator = Nominatim(user_agent=USER_AGENT)
-    time, location = get_context_from_message(location_message)
-
-    lat, lon = get_lat_lon_from_location(location, geolocator)
-    if lat is None or lon is None:
-        return "Location not found"
-
-    current_time = get_current_time(time)
-    weather_report = fetch_weather_report(lat, lon, current_time)
-    return weather_report
+    time, location = get_context_from_message(msg) if msg else ("", "")
+
+    if not locations and not times:
+        lat, lon = get_lat_lon_from_location(location, geolocator)
+        if lat is None or lon is None:
+            return "Location not found"
+
+        current_time = get_current_time(time)
+        weather_report = fetch_weather_report(lat, lon, current_time)
+        return weather_report
+
+    locations = locations or [location]
+    timestamps = [get_current_time(t) for t in times or [time]]
+
+    def forecast_for(place: str):
+        lat, lon = get_lat_lon_from_location(place, geolocator)
+        if lat is None or lon is None:
+            return "Location not found"
+        try:
+            return get_forecast(lat, lon)
+        except ValueError as e:
+            return str(e)
+
+    # One forecast per place covers every time, so only the places are fetched concurrently
+    with ThreadPoolExecutor(max_workers=min(WEATHER_WORKERS, len(locations))) as pool:
+        forecasts = list(pool.map(forecast_for, locations))
+
+    rows = ["Location | Time | Temperature | Humidity | Description"]
+
+    for place, forecast in zip(locations, forecasts):
+        place = place or "Current location"
+
+        if isinstance(forecast, str):
+            rows.append(f"{place} | - | - | - | {forecast}")
+            continue
+
+        for timestamp in timestamps:
+            slot = forecast.nearest(timestamp)
+            rows.append(
+                f"{place} | {datetime.fromtimestamp(timestamp).strftime('%d/%m/%Y %H:%M')} | "
+                f"{slot['main']['temp']}°C | {slot['main']['humidity']}% | "
+                f"{slot['weather'][0]['description'].capitalize()}"
+            )
+
+    return "\n".join(rows)
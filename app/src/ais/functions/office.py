@@ -4,12 +4,15 @@ import pandas as pd
 from typing import Optional
 
 from src.utils.files import get_file_hashmap, find
+from src.utils.file_registry import get_file_registry
 
 
 async def findFile(client, asst_id, filename: Optional[str] = None) -> str:
     """
     The findFile function takes in a filename and returns the file_id of that file.
         If the file is not found, it will return 'File not found'.
+        Without a filename, the most recently uploaded file is returned.
+        Uploads are looked up in the local file registry first.
 
     Parameters
     ----------
@@ -26,25 +29,26 @@ async def findFile(client, asst_id, filename: Optional[str] = None) -> str:
         The file_id of the file with name filename
     """
     print(f"\nDebug--- Called findFile with parameters: {filename}\n")
+    registry = get_file_registry()
 
-    if filename:
+    entry = registry.by_name(asst_id, filename) if filename else registry.most_recent(asst_id)
+
+    if entry is not None:
+        file_id = entry["file_id"]
+
+    # Files uploaded before the registry existed are only known to the API
+    elif filename:
         file_id_by_name = await get_file_hashmap(client, asst_id)
 
         file_id = file_id_by_name.get(filename, "File not found")
 
     else:
-        org_files = client.files.list().data
-        most_recent_file = sorted(
-            org_files, key=lambda x: x["created_at"], reverse=True
-        )[0]
-        file_id = most_recent_file["id"]
-
-        assts = client.beta.assistants
-        assistant_files = assts.files.list(assistant_id=asst_id).data
-        asst_file_ids = {file.id for file in assistant_files}
-
-        if not file_id in asst_file_ids:
-            file_id = "File exists but not in assistant's files."
+        assistant_files = client.beta.assistants.files.list(assistant_id=asst_id).data
+
+        if assistant_files:
+            file_id = max(assistant_files, key=lambda x: x.created_at).id
+        else:
+            file_id = "File not found"
 
     print(f"\nDebug--- File ID: {file_id}\n")
 
@@ -65,6 +65,10 @@ class ChatApp(App):
         self.conv = await assistant.load_or_create_conv(False)
         self.query_one(Input).focus()
 
+    async def on_unmount(self) -> None:
+        """Flush the conversation memory before exiting."""
+        await self.asst.close()
+
     def action_clear(self) -> None:
         """Clear the conversation and reset widgets."""
         # self.conversation.clear()
@@ -65,6 +65,7 @@ async def cli():
         cmd = Cmd.from_input(user_input)
 
         if cmd == Cmd.Quit:
+            await asst.close()
             break
 
         elif cmd.startswith(Cmd.Chat):
@@ -74,6 +75,7 @@ async def cli():
             asst_msg(res)
 
         elif cmd == Cmd.RefreshAll:
+            await asst.close()
             asst = Assistant(DEFAULT_DIR)
             await asst.init_from_dir(True)
             await asst.load_or_create_conv(True)
@@ -0,0 +1,140 @@
+import time
+
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+
+Interval = Tuple[datetime, datetime, str]
+
+
+def to_local_naive(dt: datetime) -> datetime:
+    """
+    Converts a timezone-aware datetime to naive local time, so O365 events and
+    dateparser results can be compared directly.
+    """
+    if dt.tzinfo is not None:
+        return dt.astimezone().replace(tzinfo=None)
+    return dt
+
+
+class CalendarIndex:
+    """
+    The CalendarIndex class is a local, sorted view of calendar events used to
+    detect conflicts and propose free slots without another Graph round trip.
+
+    Attributes
+    ----------
+        starts: list[datetime]
+            The sorted start times of the indexed events
+        events: list[Interval]
+            The (start, end, subject) tuples, in the same order as starts
+        window: tuple[datetime, datetime]
+            The time range covered by the index
+        built_at: float
+            The monotonic time at which the index was built
+
+    Methods
+    -------
+        add(start: datetime, end: datetime, subject: str)
+            Insert an event into the index
+        covers(start: datetime, end: datetime)
+            Check whether a range lies inside the indexed window
+        overlapping(start: datetime, end: datetime)
+            Return the events overlapping a range
+        free_slots(start: datetime, duration: timedelta, count: int)
+            Return the free slots of a given duration nearest to start
+    """
+
+    def __init__(
+        self,
+        events: Iterable[Interval],
+        window_start: datetime,
+        window_end: datetime,
+    ) -> None:
+        self.starts: List[datetime] = []
+        self.events: List[Interval] = []
+        self.window = (window_start, window_end)
+        self.built_at = time.monotonic()
+        self._max_duration = timedelta(0)
+
+        for start, end, subject in sorted(events, key=lambda e: e[0]):
+            self.add(start, end, subject)
+
+    def add(self, start: datetime, end: datetime, subject: str) -> None:
+        start, end = to_local_naive(start), to_local_naive(end)
+        idx = bisect_left(self.starts, start)
+        self.starts.insert(idx, start)
+        self.events.insert(idx, (start, end, subject))
+        self._max_duration = max(self._max_duration, end - start)
+
+    def is_stale(self, ttl: float) -> bool:
+        return time.monotonic() - self.built_at > ttl
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        return self.window[0] <= start and end <= self.window[1]
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Interval]:
+        """
+        Returns the events overlapping [start, end). Only events starting
+        within the longest indexed duration before `start` can overlap, so the
+        scan is bounded by two binary searches.
+        """
+        lo = bisect_left(self.starts, start - self._max_duration)
+        hi = bisect_left(self.starts, end)
+
+        return [event for event in self.events[lo:hi] if event[1] > start]
+
+    def _busy(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        merged: List[Tuple[datetime, datetime]] = []
+
+        for ev_start, ev_end, _ in self.overlapping(start, end):
+            if merged and ev_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], ev_end))
+            else:
+                merged.append((ev_start, ev_end))
+
+        return merged
+
+    def free_slots(
+        self,
+        start: datetime,
+        duration: timedelta,
+        count: int = 3,
+        horizon: Optional[timedelta] = None,
+    ) -> List[Tuple[datetime, datetime]]:
+        """
+        Returns up to `count` free slots of `duration`, ordered by distance from
+        the requested start. The search is limited to `horizon` around the
+        requested start and clipped to the indexed window.
+        """
+        horizon = horizon or timedelta(days=2)
+        lower = max(self.window[0], start - horizon)
+        upper = min(self.window[1], start + duration + horizon)
+
+        gaps = []
+        cursor = lower
+        for busy_start, busy_end in self._busy(lower, upper):
+            if busy_start > cursor:
+                gaps.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        if cursor < upper:
+            gaps.append((cursor, upper))
+
+        candidates = []
+        for gap_start, gap_end in gaps:
+            if gap_end - gap_start < duration:
+                continue
+            slot_start = min(max(start, gap_start), gap_end - duration)
+            candidates.append((slot_start, slot_start + duration))
+
+        candidates.sort(key=lambda slot: abs(slot[0] - start))
+        return candidates[:count]
+
+
+def insort_event(index: CalendarIndex, start: datetime, end: datetime, subject: str):
+    """
+    Records a newly saved event in the index, if it falls inside the window.
+    """
+    if index.covers(to_local_naive(start), to_local_naive(end)):
+        index.add(start, end, subject)
@@ -0,0 +1,174 @@
+import re
+import importlib
+
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable
+
+from src.utils.database import MemoryStore, now_ms
+
+
+Summarizer = Callable[[list[str]], str]
+
+# The role prefixes are included so they don't outweigh the content
+STOPWORDS = {
+    "user", "assistant", "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "for", "from",
+    "have", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "so", "that",
+    "the", "this", "to", "was", "we", "what", "with", "you", "your",
+}
+
+
+def extractive_summarizer(messages: list[str], max_sentences: int = 5) -> str:
+    """
+    Summarizes messages by keeping the sentences whose words are most frequent across the
+    whole group, in their original order. Runs locally, without any model call.
+    """
+    # Repeated sentences are kept once, in order of first appearance
+    sentences = list(
+        dict.fromkeys(
+            sentence.strip()
+            for message in messages
+            for sentence in re.split(r"(?<=[.!?])\s+|\n+", message)
+            if sentence.strip()
+        )
+    )
+
+    if len(sentences) <= max_sentences:
+        return " ".join(sentences)
+
+    def words(text: str) -> list[str]:
+        return [w for w in re.findall(r"\w+", text.lower()) if w not in STOPWORDS]
+
+    frequencies = Counter(w for sentence in sentences for w in words(sentence))
+
+    def score(sentence: str) -> float:
+        sentence_words = words(sentence)
+        if not sentence_words:
+            return 0.0
+        return sum(frequencies[w] for w in sentence_words) / len(sentence_words)
+
+    ranked = sorted(range(len(sentences)), key=lambda i: score(sentences[i]), reverse=True)
+    keep = sorted(ranked[:max_sentences])
+
+    return " ".join(sentences[i] for i in keep)
+
+
+SUMMARIZERS: dict[str, Summarizer] = {
+    "extractive": extractive_summarizer,
+}
+
+
+def get_summarizer(name: str) -> Summarizer:
+    """
+    Returns a registered summarizer, or imports one given as 'package.module:function'.
+    """
+    if name in SUMMARIZERS:
+        return SUMMARIZERS[name]
+
+    if ":" not in name:
+        raise ValueError(
+            f"Unknown summarizer '{name}'; must be one of {', '.join(SUMMARIZERS)} or 'module:function'"
+        )
+
+    module_name, func_name = name.split(":", 1)
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _period_range(period: str, cutoff: int) -> tuple[int, int]:
+    """
+    Returns the epoch-millisecond range of a period, a local date or 'all', clipped to the cutoff.
+    """
+    if period == "all":
+        return 0, cutoff
+
+    day = datetime.strptime(period, "%Y-%m-%d")
+    start = int(day.timestamp() * 1000)
+    end = int((day + timedelta(days=1)).timestamp() * 1000)
+
+    return start, min(end, cutoff)
+
+
+def compact_memory(
+    memory: MemoryStore,
+    raw_days: float,
+    group_by: str = "day",
+    summarizer: Summarizer = extractive_summarizer,
+    summary_days: float = 0,
+) -> int:
+    """
+    The compact_memory function rolls raw memory rows older than `raw_days` into summaries,
+    one per thread and day (or per thread), and deletes the summarized rows.
+    Summaries older than `summary_days` are deleted too, unless it is 0.
+
+    Parameters
+    ----------
+        memory: MemoryStore
+            The conversation memory store
+        raw_days: float
+            How long raw rows are kept
+        group_by: str
+            'day' for one summary per thread and day, 'thread' for one per thread
+        summarizer: Summarizer
+            Turns the messages of a group into a summary
+        summary_days: float
+            How long summaries are kept, 0 to keep them forever
+
+    Returns
+    -------
+
+        The number of raw rows compacted
+    """
+    if group_by not in ("day", "thread"):
+        raise ValueError("Invalid group_by; must be one of 'day' or 'thread'")
+
+    cutoff = now_ms() - int(raw_days * 86_400_000)
+    period = (
+        "date(time / 1000, 'unixepoch', 'localtime')" if group_by == "day" else "'all'"
+    )
+    con = memory.connection()
+
+    groups = con.execute(
+        f"SELECT thread_id, {period} AS period FROM memory "
+        "WHERE time < ? GROUP BY thread_id, period",
+        (cutoff,),
+    ).fetchall()
+
+    compacted = 0
+
+    # One group is loaded at a time, so memory use is bounded by the busiest day or thread
+    for thread_id, group_period in groups:
+        start, end = _period_range(group_period, cutoff)
+
+        # A time range, rather than the period expression, lets the (thread_id, time) index
+        # find the rows of the group
+        group = con.execute(
+            "SELECT id, role, time, message FROM memory "
+            "WHERE thread_id IS ? AND time >= ? AND time < ? ORDER BY time",
+            (thread_id, start, end),
+        ).fetchall()
+
+        if not group:
+            continue
+
+        summary = summarizer([f"{role}: {message}" for _, role, _, message in group])
+
+        with con:
+            con.execute(
+                "INSERT INTO memory_summaries "
+                "(thread_id, period, first_time, last_time, rows, summary) VALUES (?, ?, ?, ?, ?, ?)",
+                (thread_id, group_period, group[0][2], group[-1][2], len(group), summary),
+            )
+            con.executemany(
+                "DELETE FROM memory WHERE id = ?", [(row[0],) for row in group]
+            )
+
+        compacted += len(group)
+
+    if summary_days:
+        with con:
+            con.execute(
+                "DELETE FROM memory_summaries WHERE last_time < ?",
+                (now_ms() - int(summary_days * 86_400_000),),
+            )
+
+    return compacted
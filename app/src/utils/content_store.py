@@ -0,0 +1,78 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+from typing import BinaryIO
+
+from src.utils.database import PERSISTANCE_DIR
+
+
+BLOBS_DIR = os.path.join(PERSISTANCE_DIR, "blobs")
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ContentStore:
+    """
+    The ContentStore class stores files once per content, under their SHA-256, and exposes
+    them under any number of names. Names are hard links to the stored content when the
+    filesystem allows it, and copies otherwise.
+
+    Attributes
+    ----------
+        root: str
+            The directory of the stored contents
+
+    Methods
+    -------
+        put(stream: BinaryIO)
+            Store the content read from the stream and return its SHA-256
+        path(sha256: str)
+            Return the path of a stored content
+        link(sha256: str, dst: Path)
+            Expose a stored content under the path `dst`
+    """
+
+    def __init__(self, root: str = BLOBS_DIR) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, sha256: str) -> Path:
+        return Path(self.root, sha256[:2], sha256)
+
+    def put(self, stream: BinaryIO) -> str:
+        digest = hashlib.sha256()
+
+        # Hashed while written, so the content is read only once
+        with tempfile.NamedTemporaryFile(dir=self.root, delete=False) as tmp:
+            for chunk in iter(lambda: stream.read(COPY_BUFFER_SIZE), b""):
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        sha256 = digest.hexdigest()
+        blob = self.path(sha256)
+
+        if blob.exists():
+            os.remove(tmp.name)
+        else:
+            blob.parent.mkdir(exist_ok=True)
+            os.replace(tmp.name, blob)
+
+        return sha256
+
+    def link(self, sha256: str, dst: Path) -> Path:
+        dst = Path(dst)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+
+        if dst.exists():
+            if dst.samefile(self.path(sha256)):
+                return dst
+            dst.unlink()
+
+        try:
+            os.link(self.path(sha256), dst)
+        except OSError:
+            shutil.copyfile(self.path(sha256), dst)
+
+        return dst
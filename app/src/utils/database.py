@@ -1,32 +1,584 @@
+import re
 import sqlite3
 import os
+import time
+import asyncio
 import datetime
+import threading
 
+from typing import Callable, Optional
 
-def create_or_load_db() -> sqlite3.Connection:
-    db_path = r"app\agent\.agent\persistance\memory.db"
-    db_dir = os.path.dirname(db_path)
+PERSISTANCE_DIR = os.path.join("app", "agent", ".agent", "persistance")
+MEMORY_DB_PATH = os.path.join(PERSISTANCE_DIR, "memory.db")
 
-    if not os.path.exists(db_dir):
-        os.makedirs(db_dir)
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+RECALL_HALF_LIFE_DAYS = 30
+RECALL_CANDIDATES = 5  # BM25 candidates fetched per requested result before recency re-ranking
+WRITE_RETRIES = 3  # attempts at committing a batch before it is held back for the next flush
+WRITE_RETRY_DELAY = 0.5  # seconds, doubled after each failed attempt
 
-    con = sqlite3.connect(db_path)
-    cur = con.cursor()
-    cur.execute(
-        "CREATE TABLE IF NOT EXISTS memory (role TEXT, time TEXT, message TEXT)"
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _legacy_time_to_ms(value) -> int:
+    try:
+        return int(datetime.datetime.fromisoformat(str(value)).timestamp() * 1000)
+    except ValueError:
+        return 0
+
+
+def _table_columns(con: sqlite3.Connection, table: str) -> list[str]:
+    return [row[1] for row in con.execute(f"PRAGMA table_info({table})")]
+
+
+def _migrate_to_v1(con: sqlite3.Connection) -> None:
+    """
+    Replaces the unkeyed (role, time, message) table with a keyed, thread-aware one.
+    Legacy text timestamps, written by datetime.now(), are converted to epoch milliseconds.
+    A memory_legacy table left over by an interrupted migration is picked up again.
+    """
+    columns = _table_columns(con, "memory")
+
+    if columns and "id" not in columns:
+        con.execute("ALTER TABLE memory RENAME TO memory_legacy")
+
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS memory ("
+        "id INTEGER PRIMARY KEY, "
+        "thread_id TEXT, "
+        "assistant_id TEXT, "
+        "role TEXT NOT NULL, "
+        "time INTEGER NOT NULL, "
+        "message TEXT NOT NULL)"
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_memory_thread_time ON memory (thread_id, time)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_memory_time ON memory (time)")
+
+    if _table_columns(con, "memory_legacy"):
+        # While memory_legacy exists the database isn't migrated, so memory can only
+        # hold a partial copy of it
+        con.execute("DELETE FROM memory")
+        cur = con.execute("SELECT role, time, message FROM memory_legacy ORDER BY rowid")
+
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            con.executemany(
+                "INSERT INTO memory (role, time, message) VALUES (?, ?, ?)",
+                [(role, _legacy_time_to_ms(t), message or "") for role, t, message in rows],
+            )
+
+        con.execute("DROP TABLE memory_legacy")
+
+
+def _migrate_to_v2(con: sqlite3.Connection) -> None:
+    """
+    Adds an FTS5 index over memory messages, kept in sync by triggers.
+    """
+    con.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5("
+        "message, content='memory', content_rowid='id', tokenize='porter unicode61')"
+    )
+    con.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_fts_insert AFTER INSERT ON memory BEGIN "
+        "INSERT INTO memory_fts (rowid, message) VALUES (new.id, new.message); END"
+    )
+    con.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_fts_delete AFTER DELETE ON memory BEGIN "
+        "INSERT INTO memory_fts (memory_fts, rowid, message) VALUES ('delete', old.id, old.message); END"
+    )
+    con.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_fts_update AFTER UPDATE OF message ON memory BEGIN "
+        "INSERT INTO memory_fts (memory_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+        "INSERT INTO memory_fts (rowid, message) VALUES (new.id, new.message); END"
+    )
+    con.execute("INSERT INTO memory_fts (memory_fts) VALUES ('rebuild')")
+
+
+def _migrate_to_v3(con: sqlite3.Connection) -> None:
+    """
+    Adds the bookkeeping for incremental memory exports: the exported segments and a key-value state table.
+    """
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS memory_segments ("
+        "name TEXT PRIMARY KEY, "
+        "first_id INTEGER NOT NULL, "
+        "last_id INTEGER NOT NULL, "
+        "rows INTEGER NOT NULL, "
+        "created INTEGER NOT NULL, "
+        "file_id TEXT)"
+    )
+    con.execute("CREATE TABLE IF NOT EXISTS memory_state (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def _migrate_to_v4(con: sqlite3.Connection) -> None:
+    """
+    Adds the table holding the summaries that replace compacted raw rows.
+    """
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS memory_summaries ("
+        "id INTEGER PRIMARY KEY, "
+        "thread_id TEXT, "
+        "period TEXT NOT NULL, "
+        "first_time INTEGER NOT NULL, "
+        "last_time INTEGER NOT NULL, "
+        "rows INTEGER NOT NULL, "
+        "summary TEXT NOT NULL)"
+    )
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_memory_summaries_thread_time ON memory_summaries (thread_id, first_time)"
+    )
+
+
+def _migrate_to_v5(con: sqlite3.Connection) -> None:
+    """
+    Adds an FTS5 index over the summaries, kept in sync by triggers, so searches find
+    compacted conversations too.
+    """
+    con.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS memory_summaries_fts USING fts5("
+        "summary, content='memory_summaries', content_rowid='id', tokenize='porter unicode61')"
+    )
+    con.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_summaries_fts_insert AFTER INSERT ON memory_summaries BEGIN "
+        "INSERT INTO memory_summaries_fts (rowid, summary) VALUES (new.id, new.summary); END"
     )
-    con.commit()
+    con.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_summaries_fts_delete AFTER DELETE ON memory_summaries BEGIN "
+        "INSERT INTO memory_summaries_fts (memory_summaries_fts, rowid, summary) "
+        "VALUES ('delete', old.id, old.summary); END"
+    )
+    con.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_summaries_fts_update AFTER UPDATE OF summary ON memory_summaries BEGIN "
+        "INSERT INTO memory_summaries_fts (memory_summaries_fts, rowid, summary) "
+        "VALUES ('delete', old.id, old.summary); "
+        "INSERT INTO memory_summaries_fts (rowid, summary) VALUES (new.id, new.summary); END"
+    )
+    con.execute("INSERT INTO memory_summaries_fts (memory_summaries_fts) VALUES ('rebuild')")
+
+
+# MIGRATIONS[n] brings a database from user_version n to n + 1
+MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    _migrate_to_v1,
+    _migrate_to_v2,
+    _migrate_to_v3,
+    _migrate_to_v4,
+    _migrate_to_v5,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(con: sqlite3.Connection) -> int:
+    """
+    Applies the pending migrations, each in its own transaction, and returns the schema version.
+    sqlite3 doesn't open transactions for DDL by itself, so they are opened explicitly; a
+    migration interrupted midway is rolled back, and its steps are idempotent either way.
+    """
+    isolation_level = con.isolation_level
+    con.isolation_level = None
 
-    return con
+    try:
+        while True:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                # Read inside the transaction, so a concurrent migration isn't applied twice
+                (version,) = con.execute("PRAGMA user_version").fetchone()
+                if version >= SCHEMA_VERSION:
+                    con.execute("COMMIT")
+                    return version
 
+                MIGRATIONS[version](con)
+                con.execute(f"PRAGMA user_version = {version + 1}")
+                con.execute("COMMIT")
 
-def write_to_memory(role, val):
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
 
-    con = create_or_load_db()
-    cur = con.cursor()
-    cur.execute(
-        "INSERT INTO memory (role, time, message) VALUES (?, ?, ?)",
-        (role, datetime.datetime.now(), val),
+    finally:
+        con.isolation_level = isolation_level
+
+
+class MemoryStore:
+    """
+    The MemoryStore class is a long-lived handle on the conversation memory database.
+    Each thread gets its own connection, opened once and reused; the database runs in WAL mode,
+    and statements are kept as constant SQL so sqlite3's per-connection statement cache
+    prepares each of them only once.
+
+    Attributes
+    ----------
+        path: str
+            The path of the SQLite database
+        synchronous: str
+            The SQLite synchronous mode, one of OFF, NORMAL, FULL or EXTRA
+        version: int
+            The schema version, after migrations
+
+    Methods
+    -------
+        connection()
+            Return the connection of the calling thread
+        write(role: str, message: str, thread_id: Optional[str], assistant_id: Optional[str])
+            Insert a message into memory
+        write_many(rows: list[tuple])
+            Insert (thread_id, assistant_id, role, time, message) rows in a single transaction
+        rows()
+            Iterate over the memory rows
+        search(query: str, limit: int, since: Optional[int])
+            Full-text search ranked by BM25 and recency
+        summaries()
+            Iterate over the summaries of compacted rows
+        high_water_mark()
+            Return the last row id covered by an exported segment
+        segments()
+            Return the exported segments, oldest first
+        get_state(key: str) / set_state(key: str, value: str)
+            Read and write export bookkeeping values
+        close()
+            Close every connection opened by the store
+    """
+
+    INSERT_SQL = (
+        "INSERT INTO memory (thread_id, assistant_id, role, time, message) "
+        "VALUES (?, ?, ?, ?, ?)"
+    )
+    SELECT_SQL = (
+        "SELECT id, thread_id, assistant_id, role, time, message FROM memory ORDER BY id"
     )
-    con.commit()
-    con.close()
+
+    def __init__(self, path: str = MEMORY_DB_PATH, synchronous: str = "NORMAL") -> None:
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(
+                f"Invalid synchronous mode '{synchronous}'; must be one of {', '.join(SYNCHRONOUS_MODES)}"
+            )
+
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: list[sqlite3.Connection] = []
+
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        con = self.connection()
+        # WAL is persistent, so this only has an effect the first time
+        con.execute("PRAGMA journal_mode = WAL")
+        self.version = migrate(con)
+
+    def connection(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+
+        if con is None:
+            con = sqlite3.connect(self.path, check_same_thread=False)
+            con.execute(f"PRAGMA synchronous = {self.synchronous}")
+            self._local.con = con
+
+            with self._lock:
+                self._connections.append(con)
+
+        return con
+
+    def write(
+        self,
+        role: str,
+        message: str,
+        thread_id: Optional[str] = None,
+        assistant_id: Optional[str] = None,
+    ) -> None:
+        con = self.connection()
+        with con:
+            con.execute(self.INSERT_SQL, (thread_id, assistant_id, role, now_ms(), message))
+
+    def write_many(self, rows: list[tuple]) -> None:
+        con = self.connection()
+        with con:
+            con.executemany(self.INSERT_SQL, rows)
+
+    def rows(
+        self,
+        after_id: int = 0,
+        upto_id: Optional[int] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        thread_id: Optional[str] = None,
+    ) -> sqlite3.Cursor:
+        """
+        Returns a cursor over the memory rows, which reads them lazily. Rows are ordered by id,
+        or by time when filtering on time or thread, so either order comes straight from an
+        index and SQLite never has to sort. `since` and `until` are epoch milliseconds.
+        """
+        if after_id == 0 and upto_id is None and since is None and until is None and thread_id is None:
+            return self.connection().execute(self.SELECT_SQL)
+
+        clauses, params = [], []
+
+        if after_id:
+            clauses.append("id > ?")
+            params.append(after_id)
+        if upto_id is not None:
+            clauses.append("id <= ?")
+            params.append(upto_id)
+        if thread_id is not None:
+            clauses.append("thread_id = ?")
+            params.append(thread_id)
+        if since is not None:
+            clauses.append("time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("time < ?")
+            params.append(until)
+
+        order = "time" if thread_id is not None or since is not None or until is not None else "id"
+
+        return self.connection().execute(
+            "SELECT id, thread_id, assistant_id, role, time, message FROM memory "
+            f"WHERE {' AND '.join(clauses)} ORDER BY {order}",
+            params,
+        )
+
+    def summaries(self) -> sqlite3.Cursor:
+        return self.connection().execute(
+            "SELECT id, thread_id, period, first_time, last_time, rows, summary "
+            "FROM memory_summaries ORDER BY first_time"
+        )
+
+    def high_water_mark(self) -> int:
+        (last_id,) = self.connection().execute(
+            "SELECT COALESCE(MAX(last_id), 0) FROM memory_segments"
+        ).fetchone()
+        return last_id
+
+    def segments(self) -> list[dict]:
+        cur = self.connection().execute(
+            "SELECT name, first_id, last_id, rows, created, file_id "
+            "FROM memory_segments ORDER BY last_id"
+        )
+        columns = [column[0] for column in cur.description]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+    def add_segment(self, name: str, first_id: int, last_id: int, rows: int) -> None:
+        con = self.connection()
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO memory_segments (name, first_id, last_id, rows, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, first_id, last_id, rows, now_ms()),
+            )
+
+    def set_segment_file(self, name: str, file_id: Optional[str]) -> None:
+        con = self.connection()
+        with con:
+            con.execute(
+                "UPDATE memory_segments SET file_id = ? WHERE name = ?", (file_id, name)
+            )
+
+    def remove_segments(self, names: list[str]) -> None:
+        con = self.connection()
+        with con:
+            con.executemany(
+                "DELETE FROM memory_segments WHERE name = ?", [(name,) for name in names]
+            )
+
+    def get_state(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        row = self.connection().execute(
+            "SELECT value FROM memory_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key: str, value: str) -> None:
+        con = self.connection()
+        with con:
+            con.execute(
+                "INSERT OR REPLACE INTO memory_state (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def search(self, query: str, limit: int = 5, since: Optional[int] = None) -> list[dict]:
+        """
+        Searches the memory and the summaries of compacted rows with FTS5. Candidates are
+        ranked by BM25, then re-ranked with an exponential recency decay so recent matches win
+        over equally relevant old ones. Summaries have the role 'summary' and the time of the
+        last row they cover. `since` is an epoch-millisecond lower bound on the message time.
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+
+        # Quoted terms OR-ed together, so user text is never parsed as FTS syntax
+        match = " OR ".join(f'"{term}"' for term in terms)
+
+        rows = self.connection().execute(
+            "SELECT m.id, m.thread_id, m.role, m.time, "
+            "snippet(memory_fts, 0, '**', '**', '...', 24), bm25(memory_fts) "
+            "FROM memory_fts JOIN memory m ON m.id = memory_fts.rowid "
+            "WHERE memory_fts MATCH ? AND m.time >= ? "
+            "ORDER BY bm25(memory_fts) LIMIT ?",
+            (match, since or 0, limit * RECALL_CANDIDATES),
+        ).fetchall()
+        rows += self.connection().execute(
+            "SELECT s.id, s.thread_id, 'summary', s.last_time, "
+            "snippet(memory_summaries_fts, 0, '**', '**', '...', 24), bm25(memory_summaries_fts) "
+            "FROM memory_summaries_fts JOIN memory_summaries s ON s.id = memory_summaries_fts.rowid "
+            "WHERE memory_summaries_fts MATCH ? AND s.last_time >= ? "
+            "ORDER BY bm25(memory_summaries_fts) LIMIT ?",
+            (match, since or 0, limit * RECALL_CANDIDATES),
+        ).fetchall()
+
+        now = now_ms()
+        half_life = RECALL_HALF_LIFE_DAYS * 86_400_000
+        results = [
+            {
+                "id": row_id,
+                "thread_id": thread_id,
+                "role": role,
+                "time": time_ms,
+                "snippet": snippet,
+                # bm25() is negative, lower is better
+                "score": -rank * 0.5 ** (max(0, now - time_ms) / half_life),
+            }
+            for row_id, thread_id, role, time_ms, snippet, rank in rows
+        ]
+        results.sort(key=lambda result: result["score"], reverse=True)
+
+        return results[:limit]
+
+    def close(self) -> None:
+        with self._lock:
+            for con in self._connections:
+                con.close()
+            self._connections.clear()
+
+        self._local = threading.local()
+
+
+class MemoryWriter:
+    """
+    The MemoryWriter class is an asynchronous write-behind buffer in front of a MemoryStore.
+    Writes are queued and committed off the event loop in batches of `batch_size` rows, or
+    every `flush_interval` seconds, whichever comes first. When the queue is full, writers
+    wait for the flusher to catch up. A batch that still fails after WRITE_RETRIES attempts is
+    held back and retried by flush(), which raises if the rows still can't be committed.
+
+    Attributes
+    ----------
+        store: MemoryStore
+            The store the rows are written to
+        batch_size: int
+            The maximum number of rows committed in one transaction
+        flush_interval: float
+            The maximum time, in seconds, a row waits before being committed
+        max_queue: int
+            The number of pending rows above which writers are held back
+
+    Methods
+    -------
+        write(role: str, message: str, thread_id: Optional[str], assistant_id: Optional[str])
+            Queue a message for writing
+        flush()
+            Wait until every queued message is committed, raising if some couldn't be
+        close()
+            Flush and stop the writer, raising if some messages couldn't be committed
+    """
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        batch_size: int = 32,
+        flush_interval: float = 0.25,
+        max_queue: int = 1024,
+    ) -> None:
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._unwritten: list[tuple] = []
+
+    async def write(
+        self,
+        role: str,
+        message: str,
+        thread_id: Optional[str] = None,
+        assistant_id: Optional[str] = None,
+    ) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        # The timestamp is taken now, not when the row is committed
+        await self._queue.put((thread_id, assistant_id, role, now_ms(), message))
+
+    async def flush(self) -> None:
+        if self._task is not None and not self._task.done():
+            await self._queue.join()
+
+        if self._unwritten:
+            rows, self._unwritten = self._unwritten, []
+
+            if not await self._write(rows):
+                self._unwritten = rows + self._unwritten
+                raise sqlite3.OperationalError(
+                    f"{len(self._unwritten)} memory rows couldn't be committed"
+                )
+
+    async def close(self) -> None:
+        try:
+            await self.flush()
+
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+                self._task = None
+
+    async def _write(self, rows: list[tuple]) -> bool:
+        delay = WRITE_RETRY_DELAY
+
+        for attempt in range(1, WRITE_RETRIES + 1):
+            try:
+                await asyncio.to_thread(self.store.write_many, rows)
+                return True
+            except Exception as e:
+                print(
+                    f"\nDebug--- Failed to write {len(rows)} rows to memory "
+                    f"(attempt {attempt}/{WRITE_RETRIES}): {e}\n"
+                )
+
+            if attempt < WRITE_RETRIES:
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        return False
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                # Rows that still can't be committed are kept for flush() rather than dropped
+                if not await self._write(batch):
+                    self._unwritten.extend(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from typing import Optional
+
+from src.utils.database import PERSISTANCE_DIR
+
+
+FILE_REGISTRY_PATH = os.path.join(PERSISTANCE_DIR, "files.db")
+
+
+def sha256_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileRegistry:
+    """
+    The FileRegistry class records the files uploaded to the assistants, so questions such
+    as 'the file named X' or 'the latest file' are answered locally instead of listing every
+    file of the organization.
+
+    Attributes
+    ----------
+        path: str
+            The path of the SQLite database backing the registry
+
+    Methods
+    -------
+        record(asst_id: str, file_id: str, path: Path)
+            Record an uploaded file with its size and hash
+        remove(file_id: str)
+            Forget a file removed from the assistant
+        add_alias(asst_id: str, name: str, file_id: str)
+            Record another name of an uploaded file
+        by_name(asst_id: str, name: str)
+            Return the most recent upload or alias named `name`, or None
+        by_id(file_id: str)
+            Return the upload with that remote id, or None
+        by_hash(asst_id: str, sha256: str)
+            Return the most recent upload with that content, or None
+        most_recent(asst_id: str)
+            Return the most recently uploaded file, or None
+        forget_assistant(asst_id: str)
+            Forget every file of an assistant
+    """
+
+    def __init__(self, path: str = FILE_REGISTRY_PATH) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.row_factory = sqlite3.Row
+
+        with self._lock, self._con:
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "file_id TEXT PRIMARY KEY, asst_id TEXT NOT NULL, name TEXT NOT NULL, "
+                "path TEXT, size INTEGER, sha256 TEXT, uploaded REAL NOT NULL)"
+            )
+            self._con.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_name ON files (asst_id, name, uploaded)"
+            )
+            self._con.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_uploaded ON files (asst_id, uploaded)"
+            )
+            self._con.execute(
+                "CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (asst_id, sha256)"
+            )
+            # Other names under which already uploaded content was received
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                "asst_id TEXT NOT NULL, name TEXT NOT NULL, file_id TEXT NOT NULL, "
+                "created REAL NOT NULL, PRIMARY KEY (asst_id, name))"
+            )
+
+    def record(
+        self, asst_id: str, file_id: str, path: Path, sha256: Optional[str] = None
+    ) -> None:
+        path = Path(path)
+        size = path.stat().st_size if path.exists() else None
+        if sha256 is None and path.exists():
+            sha256 = sha256_file(path)
+
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO files (file_id, asst_id, name, path, size, sha256, uploaded) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_id, asst_id, path.name, str(path), size, sha256, time.time()),
+            )
+
+    def add_alias(self, asst_id: str, name: str, file_id: str) -> None:
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO aliases (asst_id, name, file_id, created) VALUES (?, ?, ?, ?)",
+                (asst_id, name, file_id, time.time()),
+            )
+
+    def remove(self, file_id: str) -> None:
+        with self._lock, self._con:
+            self._con.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+            self._con.execute("DELETE FROM aliases WHERE file_id = ?", (file_id,))
+
+    def by_name(self, asst_id: str, name: str) -> Optional[dict]:
+        # The most recent of the uploads and aliases with that name
+        with self._lock:
+            row = self._con.execute(
+                "SELECT file_id, asst_id, name, path, size, sha256, uploaded FROM files "
+                "WHERE asst_id = ? AND name = ? "
+                "UNION ALL "
+                "SELECT f.file_id, a.asst_id, a.name, f.path, f.size, f.sha256, a.created "
+                "FROM aliases a JOIN files f ON f.file_id = a.file_id "
+                "WHERE a.asst_id = ? AND a.name = ? "
+                "ORDER BY uploaded DESC LIMIT 1",
+                (asst_id, name, asst_id, name),
+            ).fetchone()
+
+        return dict(row) if row else None
+
+    def by_id(self, file_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT * FROM files WHERE file_id = ?", (file_id,)
+            ).fetchone()
+
+        return dict(row) if row else None
+
+    def by_hash(self, asst_id: str, sha256: str) -> Optional[dict]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT * FROM files WHERE asst_id = ? AND sha256 = ? ORDER BY uploaded DESC LIMIT 1",
+                (asst_id, sha256),
+            ).fetchone()
+
+        return dict(row) if row else None
+
+    def most_recent(self, asst_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT * FROM files WHERE asst_id = ? ORDER BY uploaded DESC LIMIT 1",
+                (asst_id,),
+            ).fetchone()
+
+        return dict(row) if row else None
+
+    def forget_assistant(self, asst_id: str) -> None:
+        with self._lock, self._con:
+            self._con.execute("DELETE FROM files WHERE asst_id = ?", (asst_id,))
+            self._con.execute("DELETE FROM aliases WHERE asst_id = ?", (asst_id,))
+
+
+_file_registry: Optional[FileRegistry] = None
+
+
+def get_file_registry() -> FileRegistry:
+    global _file_registry
+
+    if _file_registry is None:
+        _file_registry = FileRegistry()
+
+    return _file_registry
@@ -1,15 +1,26 @@
 import tomli
 import asyncio
 import os
+import time
 import json
-import fnmatch
+import shutil
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime
 from pathlib import Path
 from typing import TypeVar, List, Optional
 
-from src.utils.database import create_or_load_db
+from src.utils.database import MemoryStore, PERSISTANCE_DIR
+from src.utils.file_registry import sha256_file
 
 T = TypeVar("T")
 
+# Segments are JSONL, named .txt because file search does not index .jsonl files
+MEMORY_SEGMENTS_DIR = os.path.join(PERSISTANCE_DIR, "memory")
+PATH_INDEX_POLL_INTERVAL = 1.0  # seconds
+BUNDLE_BUFFER_SIZE = 1024 * 1024
+
 
 def load_from_toml(path: str) -> dict:
     if not os.path.exists(path):
@@ -51,6 +62,59 @@ def ensure_dir(dir_path: Path) -> bool:
         return True
 
 
+def _glob_to_regex(pattern: str) -> str:
+    # A slash anywhere but at the end anchors the pattern to the root, like in .gitignore
+    pattern = pattern.strip().rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+
+    out, i = [], 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2:]:
+            end = pattern.index("]", i + 2)
+            body = re.sub(r"([\\\[])", r"\\\1", pattern[i + 1:end])
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+
+    body = "".join(out)
+    return body if anchored else f"(?:.*/)?{body}"
+
+
+def compile_globs(globs: Optional[List[str]]) -> Optional[re.Pattern]:
+    """
+    Compiles glob patterns into one regex, matched against '/'-separated paths relative to the
+    searched directory. As in .gitignore, a pattern without a slash matches a name at any
+    depth, a pattern with one is anchored to the root, and '**' matches any number of
+    directories while '*' stays within one.
+    """
+    if not globs:
+        return None
+
+    return re.compile("|".join(f"(?:{_glob_to_regex(glob)})" for glob in globs))
+
+
+def _relative(root: str, base: str, name: str) -> str:
+    rel = os.path.relpath(os.path.join(root, name), base)
+    return rel.replace(os.sep, "/")
+
+
 def base_dir_exclude_globs(directory_path: Path, exclude_patterns=None):
     if exclude_patterns is None:
         exclude_patterns = [".git*", "target*"]
@@ -58,37 +122,126 @@ def base_dir_exclude_globs(directory_path: Path, exclude_patterns=None):
 
 
 def get_glob_set(directory_path: Path, globs):
+    """
+    Returns the files and directories under `directory_path` matching `globs`.
+    The content of a matched directory is not listed, since the directory covers it.
+    """
+    pattern = compile_globs(globs)
+    if pattern is None:
+        return []
+
     matched_files = []
     for root, dirs, files in os.walk(directory_path):
-        for file in files + dirs:
-            full_path = Path(root) / file
-            if any(fnmatch.fnmatch(str(full_path), pattern) for pattern in globs):
-                matched_files.append(full_path)
+        for file in files:
+            if pattern.fullmatch(_relative(root, directory_path, file)):
+                matched_files.append(Path(root) / file)
+
+        kept_dirs = []
+        for dir_name in dirs:
+            if pattern.fullmatch(_relative(root, directory_path, dir_name)):
+                matched_files.append(Path(root) / dir_name)
+            else:
+                kept_dirs.append(dir_name)
+        dirs[:] = kept_dirs
+
     return matched_files
 
 
-def bundle_to_file(files, dst_file):
+def _shard_path(dst_file: Path, shard: int) -> Path:
+    return dst_file.with_name(f"{dst_file.stem}-{shard}{dst_file.suffix}")
+
+
+def bundle_to_file(files, dst_file, max_bytes: Optional[int] = None) -> tuple[list[Path], bool]:
+    """
+    The bundle_to_file function concatenates files into one bundle, each under a header with
+    its path. The size, mtime and hash of every source are kept in a '.idx' sidecar, so when
+    no source changed the previous bundle is reused without being written again.
+
+    Parameters
+    ----------
+        files: list
+            The paths of the files to bundle, in order
+        dst_file: Path
+            The path of the bundle
+        max_bytes: Optional[int]
+            The maximum size of a bundle; larger bundles are split into numbered shards
+            ('name-1.ext', 'name-2.ext', ...), each holding whole files
+
+    Returns
+    -------
+
+        The paths of the bundle or its shards, and whether they were written again;
+        raises OSError if a source can't be read or the bundle can't be written
+    """
+    dst_file = Path(dst_file)
+    index_file = dst_file.with_name(dst_file.name + ".idx")
+    files = [Path(file_path) for file_path in files]
+
     try:
-        with open(dst_file, "w", encoding="utf-8") as writer:
+        previous = load_from_json(index_file)
+    except (OSError, ValueError):
+        previous = {"max_bytes": None, "shards": [], "files": {}}
+
+    entries = {}
+    for file_path in files:
+        stat = file_path.stat()
+        entry = previous["files"].get(str(file_path))
+
+        # The hash is only computed again when the size or mtime changed
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256_file(file_path)}
+
+        entries[str(file_path)] = entry
+
+    unchanged = (
+        previous["max_bytes"] == max_bytes
+        and list(previous["files"]) == list(entries)
+        and all(previous["files"][key]["sha256"] == entry["sha256"] for key, entry in entries.items())
+        and all(Path(shard).exists() for shard in previous["shards"])
+    )
+
+    if unchanged:
+        shards = [Path(shard) for shard in previous["shards"]]
+    else:
+        shards = _write_bundle(files, dst_file, max_bytes)
+
+        for stale in set(previous["shards"]) - {str(shard) for shard in shards}:
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    load_to_json(index_file, {"max_bytes": max_bytes, "shards": [str(shard) for shard in shards], "files": entries})
+
+    return shards, not unchanged
 
-            for file_path in files:
-                file_path = Path(file_path)
 
-                if not file_path.is_file():
-                    raise FileNotFoundError(f"File not found: {file_path}")
+def _write_bundle(files: list[Path], dst_file: Path, max_bytes: Optional[int]) -> list[Path]:
+    groups, size = [[]], 0
 
-                with open(file_path, "r", encoding="utf-8") as reader:
-                    writer.write(f"\n # ==== file path: {file_path} ==== \n\n")
+    for file_path in files:
+        header = f"\n # ==== file path: {file_path} ==== \n\n".encode("utf-8")
+        file_size = len(header) + file_path.stat().st_size + 2
 
-                    for line in reader:
-                        writer.write(f"{line}")
+        # A file larger than max_bytes gets a shard of its own rather than being cut
+        if max_bytes and groups[-1] and size + file_size > max_bytes:
+            groups.append([])
+            size = 0
 
-                    writer.write("\n\n")
+        groups[-1].append((file_path, header))
+        size += file_size
 
-    except Exception as e:
-        return f"An error occurred: {e}"
+    shards = [dst_file] if len(groups) == 1 else [_shard_path(dst_file, i + 1) for i in range(len(groups))]
 
-    return "Success"
+    for shard, group in zip(shards, groups):
+        with open(shard, "wb") as writer:
+            for file_path, header in group:
+                writer.write(header)
+
+                with open(file_path, "rb") as reader:
+                    shutil.copyfileobj(reader, writer, BUNDLE_BUFFER_SIZE)
+
+                writer.write(b"\n\n")
+
+    return shards
 
 
 def list_files(
@@ -96,61 +249,296 @@ def list_files(
     include_globs: Optional[List[str]] = None,
     exclude_globs: Optional[List[str]] = None,
 ) -> List[Path]:
-    def is_match(path: Path, patterns: Optional[List[str]]) -> bool:
-        if patterns is None:
-            return True
-        return any(fnmatch.fnmatch(str(path), pattern) for pattern in patterns)
+    """
+    Lists the files under `dir_path` matching `include_globs`, or every file if None, and not
+    matching `exclude_globs`. Excluded directories are pruned before descending into them.
+    As before, the walk stops one level below `dir_path` unless an include glob contains '**'.
+    See compile_globs for the pattern syntax.
+    """
+    include = compile_globs(include_globs)
+    exclude = compile_globs(exclude_globs)
 
-    # Determine depth based on include globs (simplified approach)
-    depth = 100 if include_globs and any("**" in glob for glob in include_globs) else 1
+    max_depth = 100 if include_globs and any("**" in glob for glob in include_globs) else 1
 
     matched_files = []
     for root, dirs, files in os.walk(dir_path):
-        # Calculate current depth
-        current_depth = len(Path(root).parts) - len(dir_path.parts)
-        if current_depth > depth:
-            # Stop diving into directories if max depth is exceeded
-            del dirs[:]
-            continue
-
-        paths = [Path(root) / file for file in files]
-        for path in paths:
-            # Exclude directories or files based on exclude_globs
-            if exclude_globs and is_match(path, exclude_globs):
+        if len(Path(root).parts) - len(Path(dir_path).parts) >= max_depth:
+            dirs[:] = []
+        elif exclude is not None:
+            dirs[:] = [d for d in dirs if not exclude.fullmatch(_relative(root, dir_path, d))]
+
+        for file in files:
+            rel = _relative(root, dir_path, file)
+            if exclude is not None and exclude.fullmatch(rel):
                 continue
-            # Include files based on include_globs
-            if is_match(path, include_globs):
-                matched_files.append(path)
+            if include is None or include.fullmatch(rel):
+                matched_files.append(Path(root) / file)
 
     return matched_files
 
 
-def db_to_json():
+def export_memory(
+    memory: MemoryStore,
+    dst_file: Path,
+    fmt: str = "jsonl",
+    **filters,
+) -> tuple[int, int, int]:
+    """
+    Streams memory rows to a file as they are read from the database, in JSON or JSONL.
+    Memory use does not depend on the size of the history. `filters` are passed to
+    MemoryStore.rows: after_id, upto_id, since, until (epoch ms) and thread_id.
+    Returns the first and last exported row ids and the number of rows.
+    """
+    if fmt not in ("json", "jsonl"):
+        raise ValueError("Invalid format; must be one of 'json' or 'jsonl'")
+
+    first_id, last_id, count = 0, 0, 0
+    separator = "\n" if fmt == "jsonl" else ",\n"
+
+    with open(dst_file, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[\n")
+
+        for row_id, thread_id, asst_id, role, time_ms, message in memory.rows(**filters):
+            record = {
+                "id": row_id,
+                "time": datetime.fromtimestamp(time_ms / 1000).isoformat(sep=" "),
+                "thread_id": thread_id,
+                "role": role,
+                "message": message,
+            }
+
+            if fmt == "json" and count:
+                f.write(separator)
+            f.write(json.dumps(record, ensure_ascii=False))
+            if fmt == "jsonl":
+                f.write(separator)
+
+            first_id = first_id or row_id
+            last_id = row_id
+            count += 1
+
+        if fmt == "json":
+            f.write("\n]\n")
+
+    return first_id, last_id, count
+
+
+def export_memory_segment(
+    memory: MemoryStore, segments_dir: Path = Path(MEMORY_SEGMENTS_DIR)
+) -> Optional[Path]:
+    """
+    Appends a JSONL segment holding the memory rows written since the last export.
+    Returns the segment path, or None if there was nothing new.
+    """
+    ensure_dir(segments_dir)
+    high_water_mark = memory.high_water_mark()
+
+    segment = segments_dir / f"memory-{high_water_mark + 1:010d}.txt"
+    first_id, last_id, count = export_memory(memory, segment, after_id=high_water_mark)
+
+    if count == 0:
+        segment.unlink()
+        return None
+
+    memory.add_segment(segment.name, first_id, last_id, count)
+    return segment
+
+
+def compaction_due(memory: MemoryStore, max_segments: int, interval_days: float) -> bool:
+    if len(memory.segments()) <= max_segments:
+        return False
+
+    last_compaction = int(memory.get_state("last_compaction", "0") or 0)
+    return time.time() * 1000 - last_compaction >= interval_days * 86_400_000
+
+
+def compact_memory_segments(
+    memory: MemoryStore, segments_dir: Path = Path(MEMORY_SEGMENTS_DIR)
+) -> tuple[Optional[Path], list[dict]]:
+    """
+    Rewrites every exported segment as a single base segment, read back from the database,
+    followed by the summaries of compacted rows. Returns the new segment and the records
+    of the segments it replaces.
+    """
+    old_segments = memory.segments()
+    if not old_segments:
+        return None, []
+
+    ensure_dir(segments_dir)
+    high_water_mark = old_segments[-1]["last_id"]
+
+    segment = segments_dir / f"memory-base-{high_water_mark:010d}.txt"
+    first_id, _, count = export_memory(memory, segment, upto_id=high_water_mark)
+
+    with open(segment, "a", encoding="utf-8") as f:
+        for _, thread_id, period, first_time, last_time, rows, summary in memory.summaries():
+            record = {
+                "summary": summary,
+                "thread_id": thread_id,
+                "period": period,
+                "from": datetime.fromtimestamp(first_time / 1000).isoformat(sep=" "),
+                "to": datetime.fromtimestamp(last_time / 1000).isoformat(sep=" "),
+                "rows": rows,
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    memory.remove_segments([old["name"] for old in old_segments])
+    # The base keeps the high-water mark even if the rows behind it were pruned
+    memory.add_segment(segment.name, first_id, high_water_mark, count)
+    memory.set_state("last_compaction", str(int(time.time() * 1000)))
+
+    for old in old_segments:
+        old_path = segments_dir / old["name"]
+        if old["name"] != segment.name and old_path.exists():
+            old_path.unlink()
+
+    return segment, [old for old in old_segments if old["name"] != segment.name]
+
+
+class PathIndex:
+    """
+    The PathIndex class maps file basenames to their paths under a root directory.
+    The tree is walked once; afterwards only the directories' mtimes are polled, and only
+    the directories whose content changed are listed again.
+
+    Attributes
+    ----------
+        root: str
+            The absolute path of the indexed directory
+        poll_interval: float
+            The minimum delay between two polls, in seconds; a missed lookup always polls
+
+    Methods
+    -------
+        lookup(name: str)
+            Return every path of the files named `name`, sorted
+        refresh()
+            Update the index with the directories changed since the last poll
+    """
+
+    def __init__(self, root: str, poll_interval: float = PATH_INDEX_POLL_INTERVAL) -> None:
+        self.root = os.path.abspath(root)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._paths: dict[str, set[str]] = defaultdict(set)
+        self._files: dict[str, set[str]] = {}
+        self._subdirs: dict[str, set[str]] = {}
+        self._mtimes: dict[str, Optional[float]] = {}
+        self._polled = 0.0
+
+        with self._lock:
+            self._scan_dir(self.root)
+            self._polled = time.monotonic()
+
+    def _scan_dir(self, directory: str) -> None:
+        try:
+            mtime = os.stat(directory).st_mtime
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            self._drop_tree(directory)
+            # The root stays registered while missing, so polls notice when it appears
+            if directory == self.root:
+                self._mtimes[directory] = None
+            return
+
+        files = {e.name for e in entries if not e.is_dir(follow_symlinks=False)}
+        subdirs = {e.path for e in entries if e.is_dir(follow_symlinks=False)}
+
+        for name in self._files.get(directory, set()) - files:
+            self._paths[name].discard(os.path.join(directory, name))
+            if not self._paths[name]:
+                del self._paths[name]
+        for name in files:
+            self._paths[name].add(os.path.join(directory, name))
+
+        for subdir in self._subdirs.get(directory, set()) - subdirs:
+            self._drop_tree(subdir)
+
+        new_subdirs = subdirs - self._subdirs.get(directory, set())
+
+        self._files[directory] = files
+        self._subdirs[directory] = subdirs
+        self._mtimes[directory] = mtime
+
+        for subdir in new_subdirs:
+            self._scan_dir(subdir)
+
+    def _drop_tree(self, directory: str) -> None:
+        for subdir in self._subdirs.pop(directory, set()):
+            self._drop_tree(subdir)
+
+        for name in self._files.pop(directory, set()):
+            self._paths[name].discard(os.path.join(directory, name))
+            if not self._paths[name]:
+                del self._paths[name]
+
+        self._mtimes.pop(directory, None)
+
+    def _refresh(self) -> None:
+        for directory, mtime in list(self._mtimes.items()):
+            # Already dropped with a removed parent earlier in this poll
+            if directory not in self._mtimes:
+                continue
+            try:
+                changed = os.stat(directory).st_mtime != mtime
+            except OSError:
+                changed = True
+            if changed:
+                self._scan_dir(directory)
+
+        self._polled = time.monotonic()
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._refresh()
 
-    con = create_or_load_db()
-    cur = con.cursor()
+    def lookup(self, name: str) -> list[str]:
+        # Read under the lock, since another thread may be rescanning
+        with self._lock:
+            if time.monotonic() - self._polled > self.poll_interval:
+                self._refresh()
 
-    cur.execute("SELECT * FROM memory")
+            paths = set(self._paths.get(name, ()))
+            # A miss or a vanished path may be a change made since the last poll
+            if not paths or not all(os.path.exists(path) for path in paths):
+                self._refresh()
+                paths = set(self._paths.get(name, ()))
 
-    rows = cur.fetchall()
+        return sorted(paths, key=lambda path: (path.count(os.sep), path))
 
-    data = {}
 
-    for role, date, message in rows:
-        if role not in data:
-            data[role] = {}
-        data[role][date] = {"message": message}
+_path_indexes: dict[str, PathIndex] = {}
 
-    con.close()
 
-    with open(r"app\agent\.agent\persistance\memory.json", "w") as f:
-        json.dump(data, f, indent=4)
+def get_path_index(path: str) -> PathIndex:
+    root = os.path.abspath(path)
+
+    if root not in _path_indexes:
+        _path_indexes[root] = PathIndex(root)
+
+    return _path_indexes[root]
+
+
+def find_all(name, path=os.path.dirname(os.path.abspath(__file__))) -> list[str]:
+    index = get_path_index(path)
+
+    # Paths are returned under `path` as given, relative if it is, like os.walk(path) would
+    return [os.path.join(path, os.path.relpath(found, index.root)) for found in index.lookup(name)]
 
 
 def find(name, path=os.path.dirname(os.path.abspath(__file__))):
-    for root, dirs, files in os.walk(path):
-        if name in files:
-            return os.path.join(root, name)
+    """
+    Returns the path of the file named `name` under `path`, the shallowest one if several
+    match, or None. Lookups go through a PathIndex instead of walking the tree.
+    """
+    paths = find_all(name, path)
+
+    if len(paths) > 1:
+        print(f"\nDebug--- Ambiguous file name '{name}', using '{paths[0]}' out of: {paths}\n")
+
+    return paths[0] if paths else None
 
 
 async def get_file_hashmap(client, asst_id: str):
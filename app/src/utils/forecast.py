@@ -0,0 +1,108 @@
+import threading
+import time
+
+from bisect import bisect_left
+from typing import Optional
+
+
+FORECAST_CADENCE = 3 * 3600  # seconds; OpenWeatherMap publishes 3-hour forecast steps
+FORECAST_CELL = 0.1  # degrees, about 11 km of latitude
+
+
+class Forecast:
+    """
+    The Forecast class holds the time slots of one forecast, sorted by time.
+
+    Attributes
+    ----------
+        slots: list[dict]
+            The forecast slots, as returned by the OpenWeatherMap forecast API
+        times: list[int]
+            The epoch seconds of the slots, in the same order
+        expires: float
+            When the forecast should be downloaded again, in epoch seconds
+
+    Methods
+    -------
+        nearest(timestamp: float)
+            Return the slot closest to the timestamp
+    """
+
+    def __init__(self, slots: list[dict], expires: float) -> None:
+        self.slots = sorted(slots, key=lambda slot: slot["dt"])
+        self.times = [slot["dt"] for slot in self.slots]
+        self.expires = expires
+
+    def nearest(self, timestamp: float) -> dict:
+        i = bisect_left(self.times, timestamp)
+
+        if i == 0:
+            return self.slots[0]
+        if i == len(self.times):
+            return self.slots[-1]
+
+        # The closest slot is either the first at or after the timestamp, or the one before
+        before, after = self.times[i - 1], self.times[i]
+        return self.slots[i - 1] if timestamp - before <= after - timestamp else self.slots[i]
+
+
+class ForecastCache:
+    """
+    The ForecastCache class keeps downloaded forecasts per grid cell of `cell` degrees, until
+    the provider's next 3-hour update. Nearby places and follow-up questions about other times
+    reuse the same forecast.
+
+    Attributes
+    ----------
+        cell: float
+            The size of the grid cells, in degrees
+
+    Methods
+    -------
+        get(lat: float, lon: float)
+            Return the cached forecast of the cell, or None if missing or expired
+        put(lat: float, lon: float, slots: list[dict])
+            Cache and return the forecast of the cell
+    """
+
+    def __init__(self, cell: float = FORECAST_CELL) -> None:
+        self.cell = cell
+        self._lock = threading.Lock()
+        self._forecasts: dict[tuple[int, int], Forecast] = {}
+
+    def _key(self, lat: float, lon: float) -> tuple[int, int]:
+        return round(lat / self.cell), round(lon / self.cell)
+
+    def get(self, lat: float, lon: float) -> Optional[Forecast]:
+        with self._lock:
+            forecast = self._forecasts.get(self._key(lat, lon))
+
+        if forecast is None or forecast.expires <= time.time():
+            return None
+
+        return forecast
+
+    def put(self, lat: float, lon: float, slots: list[dict]) -> Forecast:
+        now = time.time()
+        forecast = Forecast(slots, now - now % FORECAST_CADENCE + FORECAST_CADENCE)
+
+        with self._lock:
+            # Expired forecasts of other cells are dropped here rather than by a timer
+            self._forecasts = {
+                key: cached for key, cached in self._forecasts.items() if cached.expires > now
+            }
+            self._forecasts[self._key(lat, lon)] = forecast
+
+        return forecast
+
+
+_forecast_cache: Optional[ForecastCache] = None
+
+
+def get_forecast_cache() -> ForecastCache:
+    global _forecast_cache
+
+    if _forecast_cache is None:
+        _forecast_cache = ForecastCache()
+
+    return _forecast_cache
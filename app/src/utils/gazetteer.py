@@ -0,0 +1,205 @@
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+import geotext
+
+from typing import Optional
+from spacy.lang.en.stop_words import STOP_WORDS
+
+from src.utils.database import PERSISTANCE_DIR
+from src.utils.geocache import normalize_place
+
+
+GEONAMES_PATH = os.path.join(os.path.dirname(geotext.__file__), "data", "cities15000.txt")
+GAZETTEER_PATH = os.path.join(PERSISTANCE_DIR, "gazetteer.npy")
+GAZETTEER_CITIES_PATH = os.path.join(PERSISTANCE_DIR, "gazetteer-cities.npy")
+MAX_NGRAM = 4  # the longest city names looked for in a message, in words
+MAX_CODE_LENGTH = 4  # all-caps alternate names this short are codes, e.g. IATA's 'THE' for Teresina
+
+KEY_DTYPE = np.dtype([("key", "S48"), ("city", "i4"), ("population", "i4")])
+CITY_DTYPE = np.dtype(
+    [
+        ("name", "S64"),
+        ("country", "S2"),
+        ("latitude", "f4"),
+        ("longitude", "f4"),
+        ("population", "i4"),
+    ]
+)
+
+
+def _is_latin(text: str) -> bool:
+    return all(not c.isalpha() or "LATIN" in unicodedata.name(c, "") for c in text)
+
+
+def _is_code(name: str) -> bool:
+    return name.isupper() and len(name) <= MAX_CODE_LENGTH
+
+
+def _save(array: np.ndarray, dst: str) -> None:
+    # Written aside and renamed, so a concurrent reader never maps a partial file
+    np.save(dst + ".tmp.npy", array)
+    os.replace(dst + ".tmp.npy", dst)
+
+
+def compile_gazetteer(
+    src: str = GEONAMES_PATH, dst: str = GAZETTEER_PATH, cities_dst: str = GAZETTEER_CITIES_PATH
+) -> int:
+    """
+    Compiles a GeoNames city table into two arrays saved as .npy, so they can be memory-mapped:
+    the cities, and the names they are known by, sorted by normalized name, then own names
+    before alternate names, then by decreasing population. Each city is listed under its name,
+    its ASCII name, its name without qualifier ('Washington' for 'Washington, D.C.') and its
+    alternate names in Latin script, so 'New York' finds New York City and 'München' finds
+    Munich. Alternate names that are codes or common English words are left out.
+
+    Parameters
+    ----------
+        src: str
+            The path of the GeoNames table, e.g. the cities15000.txt bundled with geotext
+        dst: str
+            The path of the compiled names
+        cities_dst: str
+            The path of the compiled cities
+
+    Returns
+    -------
+
+        The number of names in the gazetteer
+    """
+    cities, keys, alternate = [], [], []
+
+    with open(src, encoding="utf-8") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            name, population = fields[1], int(fields[14] or 0)
+            primary = {
+                normalize_place(name),
+                normalize_place(fields[2]),
+                normalize_place(name.split(",")[0]),
+            }
+            alternates = {
+                normalize_place(alt)
+                for alt in fields[3].split(",")
+                if _is_latin(alt) and not _is_code(alt)
+            }
+
+            for key in primary | {alt for alt in alternates if alt not in STOP_WORDS}:
+                key_bytes = key.encode("utf-8")
+                # Keys that don't fit would be truncated into wrong prefixes
+                if key and len(key_bytes) <= KEY_DTYPE["key"].itemsize:
+                    keys.append((key_bytes, len(cities), population))
+                    alternate.append(key not in primary)
+
+            cities.append(
+                (name.encode("utf-8")[:64], fields[8].encode("ascii"),
+                 float(fields[4]), float(fields[5]), population)
+            )
+
+    keys = np.array(keys, dtype=KEY_DTYPE)
+    # A city's own name wins over another city's alternate name, e.g. London over City of London
+    keys = keys[np.lexsort((-keys["population"], np.array(alternate), keys["key"]))]
+
+    dst_dir = os.path.dirname(dst)
+    if dst_dir and not os.path.exists(dst_dir):
+        os.makedirs(dst_dir)
+
+    _save(np.array(cities, dtype=CITY_DTYPE), cities_dst)
+    _save(keys, dst)
+
+    return len(keys)
+
+
+class Gazetteer:
+    """
+    The Gazetteer class resolves city names locally with binary searches over a memory-mapped,
+    sorted array of city names. When a name is shared by several cities, the city it is the
+    own name of wins, then the most populous.
+
+    Attributes
+    ----------
+        keys: np.ndarray
+            The names of the cities, sorted by normalized name, own names first, then by
+            decreasing population
+        cities: np.ndarray
+            The cities, indexed by the 'city' field of the names
+
+    Methods
+    -------
+        lookup(name: str)
+            Return the city named `name`
+        find(text: str)
+            Return the first city named in `text`, preferring longer names
+    """
+
+    def __init__(self, path: str = GAZETTEER_PATH, cities_path: str = GAZETTEER_CITIES_PATH) -> None:
+        self.keys = np.load(path, mmap_mode="r")
+        self.cities = np.load(cities_path, mmap_mode="r")
+        self._keys = self.keys["key"]
+
+    def _city(self, i: int) -> dict:
+        city = self.cities[self.keys[i]["city"]]
+        return {
+            "name": city["name"].decode("utf-8", errors="ignore"),
+            "country": city["country"].decode("ascii"),
+            "latitude": float(city["latitude"]),
+            "longitude": float(city["longitude"]),
+            "population": int(city["population"]),
+        }
+
+    def lookup(self, name: str) -> Optional[dict]:
+        key = normalize_place(name).encode("utf-8")
+        if not key:
+            return None
+
+        # Keys are sorted own names first, so the first match is the city's own name
+        i = np.searchsorted(self._keys, key, side="left")
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._city(i)
+        return None
+
+    def find(self, text: str) -> Optional[dict]:
+        tokens = re.findall(r"\w+", unicodedata.normalize("NFKC", text))
+        words = [token.casefold() for token in tokens]
+        # In mixed-case text, a single word names a city only if it is capitalized,
+        # so 'reading' or 'nice' in a sentence aren't taken for Reading or Nice
+        cased = text != text.lower()
+
+        for n in range(min(MAX_NGRAM, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                if n == 1 and (
+                    words[i] in STOP_WORDS or (cased and not tokens[i][:1].isupper())
+                ):
+                    continue
+
+                city = self.lookup(" ".join(words[i:i + n]))
+                if city is not None:
+                    return city
+
+        return None
+
+
+_gazetteer: Optional[Gazetteer] = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Returns the shared gazetteer, compiling it first if it is missing or older than its source
+    or than this module.
+    """
+    global _gazetteer
+
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            # The names are saved last, so their time tells whether the compilation finished
+            if not os.path.exists(GAZETTEER_PATH) or os.path.getmtime(GAZETTEER_PATH) < max(
+                os.path.getmtime(GEONAMES_PATH), os.path.getmtime(__file__)
+            ):
+                compile_gazetteer(GEONAMES_PATH, GAZETTEER_PATH, GAZETTEER_CITIES_PATH)
+
+            _gazetteer = Gazetteer(GAZETTEER_PATH, GAZETTEER_CITIES_PATH)
+
+    return _gazetteer
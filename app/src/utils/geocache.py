@@ -0,0 +1,143 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from typing import Optional
+
+from src.utils.database import PERSISTANCE_DIR
+
+
+GEOCODE_DB_PATH = os.path.join(PERSISTANCE_DIR, "geocode.db")
+GEOCODE_TTL = 90 * 86_400  # seconds; places rarely move
+GEOCODE_MISS_TTL = 86_400  # seconds
+GEOCODE_MIN_INTERVAL = 1.0  # seconds; Nominatim allows one request per second
+
+
+def normalize_place(place: str) -> str:
+    """
+    Returns the cache key of a place name: case-folded words separated by single spaces,
+    so 'New York', ' new  york ' and 'NEW YORK,' share one entry.
+    """
+    place = unicodedata.normalize("NFKC", place).casefold()
+    return " ".join(re.findall(r"\w+", place))
+
+
+class GeocodeCache:
+    """
+    The GeocodeCache class is a persistent cache in front of a geopy geocoder.
+    Hits are kept for `ttl` seconds and misses for `miss_ttl` seconds, so an unknown place is
+    not looked up again on every call. Lookups that reach the geocoder are spaced by at least
+    `min_interval` seconds, across threads.
+
+    Attributes
+    ----------
+        path: str
+            The path of the SQLite database backing the cache
+        ttl: float
+            How long a found place is kept, in seconds
+        miss_ttl: float
+            How long a place that wasn't found is kept, in seconds
+        min_interval: float
+            The minimum delay between two geocoder requests, in seconds
+
+    Methods
+    -------
+        get(place: str)
+            Return the cached (latitude, longitude, address), (None, None, None) for a cached
+            miss, or None if the place isn't cached
+        geocode(place: str, geolocator)
+            Return (latitude, longitude, address), calling the geocoder on cache misses
+    """
+
+    def __init__(
+        self,
+        path: str = GEOCODE_DB_PATH,
+        ttl: float = GEOCODE_TTL,
+        miss_ttl: float = GEOCODE_MISS_TTL,
+        min_interval: float = GEOCODE_MIN_INTERVAL,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._throttle = threading.Lock()
+        self._last_request = 0.0
+
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self._con = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._con:
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "key TEXT PRIMARY KEY, latitude REAL, longitude REAL, address TEXT, "
+                "expires REAL NOT NULL)"
+            )
+
+    def get(self, place: str) -> Optional[tuple]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT latitude, longitude, address FROM geocode WHERE key = ? AND expires > ?",
+                (normalize_place(place), time.time()),
+            ).fetchone()
+
+        return row
+
+    def put(
+        self,
+        place: str,
+        latitude: Optional[float],
+        longitude: Optional[float],
+        address: Optional[str],
+    ) -> None:
+        ttl = self.ttl if latitude is not None else self.miss_ttl
+
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO geocode (key, latitude, longitude, address, expires) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (normalize_place(place), latitude, longitude, address, time.time() + ttl),
+            )
+
+    def geocode(self, place: str, geolocator) -> tuple:
+        cached = self.get(place)
+        if cached is not None:
+            return cached
+
+        # Held while waiting, so concurrent misses queue up instead of bursting
+        with self._throttle:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                location = geolocator.geocode(place)
+            finally:
+                self._last_request = time.monotonic()
+
+        # Errors propagate above without being cached; only a definite answer is stored
+        if location is None:
+            self.put(place, None, None, None)
+            return None, None, None
+
+        self.put(place, location.latitude, location.longitude, location.address)
+
+        return location.latitude, location.longitude, location.address
+
+
+_geocode_cache: Optional[GeocodeCache] = None
+
+
+def get_geocode_cache() -> GeocodeCache:
+    global _geocode_cache
+
+    if _geocode_cache is None:
+        _geocode_cache = GeocodeCache()
+
+    return _geocode_cache
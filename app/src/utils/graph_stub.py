@@ -0,0 +1,95 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class GraphStubServer:
+    """
+    The GraphStubServer class is a local stand-in for the Graph `$batch` endpoint.
+    Point `GRAPH_BATCH_URL` at `url` to exercise the batching layer offline.
+
+    Attributes
+    ----------
+        host: str
+            The interface to bind to
+        port: int
+            The port to bind to, 0 picks a free one
+        batches: list[list[dict]]
+            The requests received, one list per `$batch` call
+
+    Methods
+    -------
+        start()
+            Start serving in a background thread and return the `$batch` URL
+        stop()
+            Stop the server
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.batches: list[list[dict]] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1.0/$batch"
+
+    def start(self) -> str:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                requests = payload.get("requests", [])
+                stub.batches.append(requests)
+
+                body = json.dumps(
+                    {"responses": [stub.respond(req) for req in requests]}
+                ).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+        return self.url
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def respond(self, req: dict) -> dict:
+        """
+        Builds the per-request response, mimicking the status codes Graph returns.
+        """
+        url = req.get("url", "")
+
+        if url.endswith("/send") or url.endswith("/sendMail"):
+            return {"id": req["id"], "status": 202, "body": {}}
+
+        if req.get("method", "GET").upper() == "POST":
+            body = dict(req.get("body") or {})
+            body["id"] = f"stub-{len(self.batches)}-{req['id']}"
+            return {"id": req["id"], "status": 201, "body": body}
+
+        return {"id": req["id"], "status": 200, "body": {"value": []}}
+
+
+if __name__ == "__main__":
+    server = GraphStubServer(port=8765)
+    print(f"Graph stub listening on {server.start()}")
+    threading.Event().wait()
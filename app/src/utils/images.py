@@ -0,0 +1,165 @@
+import base64
+import io
+import os
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from typing import Optional
+from PIL import Image, ImageOps
+
+from src.utils.database import PERSISTANCE_DIR
+
+
+VISION_CACHE_PATH = os.path.join(PERSISTANCE_DIR, "vision.db")
+VISION_CACHE_TTL = 30 * 86_400  # seconds
+JPEG_QUALITY = 85
+
+# The vision model fits high detail images within 2048 x 2048, then scales the short side
+# to 768; low detail images are seen at 512 x 512. Larger images only cost payload.
+DETAIL_LIMITS = {
+    "high": (2048, 768),
+    "low": (512, 512),
+}
+SENT_AS_IS = {"JPEG", "PNG", "GIF", "WEBP"}
+EXIF_ORIENTATION = 0x0112
+
+VISION_WORKERS = 4
+VISION_MAX_IMAGES = 10  # images per request
+VISION_MAX_PAYLOAD = 15 * 1024 * 1024  # bytes of data URLs per request, under the 20 MB limit
+
+
+def prepare_image(path: Path, detail: str = "high") -> str:
+    """
+    The prepare_image function turns an image into a data URL for the vision model,
+    downsized to the resolution the model uses for `detail`. Images already small enough
+    are sent unchanged, in a format the model accepts, with their actual MIME type.
+    Others are recompressed as JPEG, or as PNG when they have transparency. Images rotated by
+    their EXIF orientation are turned upright first, since re-encoding drops the tag.
+
+    Parameters
+    ----------
+        path: Path
+            The path of the image
+        detail: str
+            'high' or 'low', the detail level of the request
+
+    Returns
+    -------
+
+        The data URL of the image
+    """
+    if detail not in DETAIL_LIMITS:
+        raise ValueError(f"Invalid detail '{detail}'; must be one of {', '.join(DETAIL_LIMITS)}")
+
+    max_long, max_short = DETAIL_LIMITS[detail]
+
+    with Image.open(path) as image:
+        image_format = image.format
+        upright = image.getexif().get(EXIF_ORIENTATION, 1) == 1
+        if not upright:
+            image = ImageOps.exif_transpose(image)
+
+        width, height = image.size
+        scale = min(1.0, max_long / max(width, height), max_short / min(width, height))
+
+        if scale == 1.0 and upright and image_format in SENT_AS_IS:
+            with open(path, "rb") as f:
+                data = f.read()
+            mime = Image.MIME[image_format]
+
+        else:
+            if scale < 1.0:
+                image = image.resize(
+                    (max(1, round(width * scale)), max(1, round(height * scale))),
+                    Image.LANCZOS,
+                )
+
+            buffer = io.BytesIO()
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                image.save(buffer, format="PNG", optimize=True)
+                mime = "image/png"
+            else:
+                image.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+                mime = "image/jpeg"
+            data = buffer.getvalue()
+
+    return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+class VisionCache:
+    """
+    The VisionCache class keeps the vision model's answers per image, query and detail, so
+    the same question about the same image is answered without a new request. The detail is
+    stored with the resolution and quality it stands for, so answers about images prepared
+    with other settings are not reused.
+
+    Attributes
+    ----------
+        path: str
+            The path of the SQLite database backing the cache
+        ttl: float
+            How long an answer is kept, in seconds
+
+    Methods
+    -------
+        get(sha256: str, query: str, detail: str)
+            Return the cached answer, or None
+        put(sha256: str, query: str, detail: str, description: str)
+            Cache an answer
+    """
+
+    def __init__(self, path: str = VISION_CACHE_PATH, ttl: float = VISION_CACHE_TTL) -> None:
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self._con = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._con:
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS descriptions ("
+                "sha256 TEXT NOT NULL, query TEXT NOT NULL, detail TEXT NOT NULL, "
+                "description TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (sha256, query, detail))"
+            )
+
+    @staticmethod
+    def _variant(detail: str) -> str:
+        max_long, max_short = DETAIL_LIMITS[detail]
+        return f"{detail}:{max_long}x{max_short}:q{JPEG_QUALITY}"
+
+    def get(self, sha256: str, query: str, detail: str) -> Optional[str]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT description FROM descriptions "
+                "WHERE sha256 = ? AND query = ? AND detail = ? AND created > ?",
+                (sha256, query.strip(), self._variant(detail), time.time() - self.ttl),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def put(self, sha256: str, query: str, detail: str, description: str) -> None:
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO descriptions (sha256, query, detail, description, created) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (sha256, query.strip(), self._variant(detail), description, time.time()),
+            )
+
+
+_vision_cache: Optional[VisionCache] = None
+
+
+def get_vision_cache() -> VisionCache:
+    global _vision_cache
+
+    if _vision_cache is None:
+        _vision_cache = VisionCache()
+
+    return _vision_cache
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+import geocoder
+
+from geopy.geocoders import Nominatim
+from typing import Optional
+
+from src.utils.geocache import get_geocode_cache
+
+
+SELF_LOCATION_TTL = 6 * 3600  # seconds
+USER_AGENT = "User"
+
+
+class SelfLocation:
+    """
+    The SelfLocation class resolves where the machine is, once per `ttl` seconds.
+    Unless a place is set, the city comes from an IP lookup and its coordinates and address
+    from the geocode cache. The place can be overridden with the AGENT_LOCATION env var,
+    which wins over the `place` given by the config.
+
+    Attributes
+    ----------
+        place: Optional[str]
+            The configured place name, used instead of the IP lookup
+        ttl: float
+            How long a resolved location is reused, in seconds
+
+    Methods
+    -------
+        get()
+            Return the location as a dict with 'city', 'latitude', 'longitude' and 'address',
+            resolving it if it is missing or expired
+        prefetch()
+            Resolve the location in a background thread
+    """
+
+    def __init__(self, place: Optional[str] = None, ttl: float = SELF_LOCATION_TTL) -> None:
+        self.place = os.environ.get("AGENT_LOCATION") or place
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._location: Optional[dict] = None
+        self._resolved = 0.0
+
+    def _resolve(self) -> dict:
+        geolocator = Nominatim(user_agent=USER_AGENT)
+
+        if self.place:
+            city, latlng = self.place, None
+        else:
+            ip = geocoder.ip("me")
+            city, latlng = ip.city, ip.latlng
+
+        if not city:
+            return {"city": None, "latitude": None, "longitude": None, "address": None}
+
+        latitude, longitude, address = get_geocode_cache().geocode(city, geolocator)
+
+        # The IP lookup's coordinates are closer to the machine than the city centre
+        if latlng:
+            latitude, longitude = latlng
+
+        return {"city": city, "latitude": latitude, "longitude": longitude, "address": address}
+
+    def get(self) -> dict:
+        # Held while resolving, so callers during a prefetch wait for it instead of repeating it
+        with self._lock:
+            if self._location is not None and time.time() - self._resolved <= self.ttl:
+                return self._location
+
+            location = self._resolve()
+
+            # A failed lookup is retried on the next call instead of being kept for the TTL
+            if location["latitude"] is not None:
+                self._location = location
+                self._resolved = time.time()
+
+            return location
+
+    def prefetch(self) -> None:
+        def run() -> None:
+            try:
+                self.get()
+            except Exception as e:
+                print(f"\nDebug--- Failed to resolve the location: {e}\n")
+
+        threading.Thread(target=run, name="self-location", daemon=True).start()
+
+
+_self_location: Optional[SelfLocation] = None
+
+
+def get_self_location() -> SelfLocation:
+    global _self_location
+
+    if _self_location is None:
+        _self_location = SelfLocation()
+
+    return _self_location
+
+
+def configure_self_location(place: Optional[str] = None, ttl: float = SELF_LOCATION_TTL) -> SelfLocation:
+    """
+    Replaces the shared self-location provider with one using the given settings.
+    """
+    global _self_location
+
+    _self_location = SelfLocation(place, ttl)
+
+    return _self_location
@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from src.utils.database import PERSISTANCE_DIR
+
+
+OUTBOX_PATH = os.path.join(PERSISTANCE_DIR, "outbox.db")
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 2.0  # seconds
+BACKOFF_MAX = 300.0  # seconds
+OUTBOX_WORKERS = 8  # messages delivered concurrently, so their Graph requests share batches
+
+
+class DeliveryRejected(Exception):
+    """
+    Raised by a delivery callback when retrying cannot succeed, e.g. the server rejected
+    the message itself. The message is marked failed without further attempts.
+    """
+
+
+class Outbox:
+    """
+    The Outbox class is a persistent queue of outgoing messages delivered by a background worker.
+    Messages are stored in SQLite, so anything still queued when the process exits is delivered
+    after the next start. The delivery callback may checkpoint its progress into the payload,
+    e.g. the id of a draft already created, so a retry resumes instead of starting over.
+
+    Attributes
+    ----------
+        path: str
+            The path of the SQLite database backing the queue
+        deliver: Callable[[dict, Callable[[dict], None]], None]
+            Delivers one payload, raising on failure; its second argument saves the payload
+            with the progress made so far
+        on_failed: Optional[Callable[[dict], None]]
+            Cleans up after a payload that won't be retried anymore
+
+    Methods
+    -------
+        enqueue(payload: dict)
+            Store a message and return its id
+        status(message_id: Optional[str], limit: int)
+            Return the delivery state of one or the most recent messages
+        start()
+            Start the delivery worker, if it isn't running
+        stop()
+            Stop the delivery worker
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[dict, Callable[[dict], None]], None],
+        path: str = OUTBOX_PATH,
+        on_failed: Optional[Callable[[dict], None]] = None,
+    ) -> None:
+        self.path = path
+        self.deliver = deliver
+        self.on_failed = on_failed
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+        db_dir = os.path.dirname(path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.row_factory = sqlite3.Row
+
+        with self._lock, self._con:
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, "
+                "last_error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._con.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt)"
+            )
+            # A message caught mid-delivery by a crash is retried
+            self._con.execute(
+                "UPDATE outbox SET status = 'queued' WHERE status = 'sending'"
+            )
+
+    def enqueue(self, payload: dict) -> str:
+        message_id = uuid.uuid4().hex[:12]
+        now = time.time()
+
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT INTO outbox (id, status, payload, next_attempt, created, updated) "
+                "VALUES (?, 'queued', ?, ?, ?, ?)",
+                (message_id, json.dumps(payload), now, now, now),
+            )
+
+        self.start()
+        self._wake.set()
+
+        return message_id
+
+    def status(self, message_id: Optional[str] = None, limit: int = 10) -> list[dict]:
+        with self._lock:
+            if message_id:
+                rows = self._con.execute(
+                    "SELECT * FROM outbox WHERE id = ?", (message_id,)
+                ).fetchall()
+            else:
+                rows = self._con.execute(
+                    "SELECT * FROM outbox ORDER BY created DESC LIMIT ?", (limit,)
+                ).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def start(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+
+        self._stopped.clear()
+        self._worker = threading.Thread(target=self._run, name="outbox", daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stopped.set()
+        self._wake.set()
+
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _claim_due(self, limit: int) -> list[sqlite3.Row]:
+        with self._lock, self._con:
+            rows = self._con.execute(
+                "SELECT * FROM outbox WHERE status = 'queued' AND next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT ?",
+                (time.time(), limit),
+            ).fetchall()
+
+            self._con.executemany(
+                "UPDATE outbox SET status = 'sending', updated = ? WHERE id = ?",
+                [(time.time(), row["id"]) for row in rows],
+            )
+
+        return rows
+
+    def _checkpoint(self, message_id: str, payload: dict) -> None:
+        with self._lock, self._con:
+            self._con.execute(
+                "UPDATE outbox SET payload = ?, updated = ? WHERE id = ?",
+                (json.dumps(payload), time.time(), message_id),
+            )
+
+    def _seconds_until_due(self) -> Optional[float]:
+        with self._lock:
+            (next_attempt,) = self._con.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE status = 'queued'"
+            ).fetchone()
+
+        if next_attempt is None:
+            return None
+
+        return max(0.0, next_attempt - time.time())
+
+    def _run(self) -> None:
+        # Due messages are delivered together, so their requests land in the same Graph batches
+        with ThreadPoolExecutor(max_workers=OUTBOX_WORKERS, thread_name_prefix="outbox") as pool:
+            while not self._stopped.is_set():
+                rows = self._claim_due(OUTBOX_WORKERS)
+
+                if not rows:
+                    self._wake.clear()
+                    self._wake.wait(self._seconds_until_due())
+                    continue
+
+                list(pool.map(self._deliver_row, rows))
+
+    def _deliver_row(self, row: sqlite3.Row) -> None:
+        payload = json.loads(row["payload"])
+
+        try:
+            self.deliver(
+                payload,
+                lambda progress, message_id=row["id"]: self._checkpoint(message_id, progress),
+            )
+
+        except Exception as e:
+            attempts = row["attempts"] + 1
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+            rejected = isinstance(e, DeliveryRejected) or attempts >= MAX_ATTEMPTS
+            status = "failed" if rejected else "queued"
+
+            with self._lock, self._con:
+                self._con.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, "
+                    "last_error = ?, updated = ? WHERE id = ?",
+                    (status, attempts, time.time() + delay, str(e), time.time(), row["id"]),
+                )
+
+            if rejected and self.on_failed is not None:
+                try:
+                    self.on_failed(payload)
+                except Exception:
+                    pass
+
+        else:
+            with self._lock, self._con:
+                self._con.execute(
+                    "UPDATE outbox SET status = 'sent', attempts = attempts + 1, "
+                    "last_error = NULL, updated = ? WHERE id = ?",
+                    (time.time(), row["id"]),
+                )
@@ -2,13 +2,16 @@ import requests
 import os
 import spacy
 import dateparser
-import geocoder
 
 from datetime import datetime
 from typing import Optional
-from geotext import GeoText
 from bs4 import BeautifulSoup
 
+from src.utils.gazetteer import get_gazetteer
+from src.utils.geocache import get_geocode_cache
+from src.utils.location import get_self_location
+from src.utils.forecast import Forecast, get_forecast_cache
+
 
 def get_context(string: str, tokens: list[str]) -> str:
     if not set(tokens).issubset({"TIME", "DATE", "GPE"}):
@@ -74,18 +77,20 @@ def get_context_from_message(message: Optional[str]) -> tuple:
 def get_lat_lon_from_location(location: str, geolocator) -> tuple:
     """
     Determines the latitude and longitude of the given location.
+    Cities are resolved locally with the gazetteer; other places go to the geocoder, whose
+    results are cached. Without a location, the machine's own location is used.
     """
     if not location:
-        location_info = geocoder.ip("me")
-        location = geolocator.geocode(location_info.city)
-    else:
-        location = GeoText(location).cities[0]
-        location = geolocator.geocode(location)
+        self_location = get_self_location().get()
+        return self_location["latitude"], self_location["longitude"]
 
-    if location:
-        return location.latitude, location.longitude
-    else:
-        return None, None
+    city = get_gazetteer().find(location)
+    if city is not None:
+        return city["latitude"], city["longitude"]
+
+    lat, lon, _ = get_geocode_cache().geocode(location, geolocator)
+
+    return lat, lon
 
 
 def get_current_time(time: str) -> float:
@@ -98,28 +103,46 @@ def get_current_time(time: str) -> float:
         return datetime.now().timestamp()
 
 
+def get_forecast(lat: float, lon: float) -> Forecast:
+    """
+    Returns the OpenWeatherMap forecast for the given coordinates, downloading it only if the
+    cached forecast of the area is missing or expired. Raises ValueError if the download fails.
+    """
+    cache = get_forecast_cache()
+    forecast = cache.get(lat, lon)
+
+    if forecast is None:
+        api_key = os.environ.get("OPENWEATHER_API_KEY")
+        url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&appid={api_key}"
+        response = requests.get(url)
+
+        if response.status_code != 200:
+            raise ValueError(f"Failed to retrieve weather data: {response.status_code}")
+
+        forecast = cache.put(lat, lon, response.json()["list"])
+
+    return forecast
+
+
 def fetch_weather_report(lat: float, lon: float, time: float) -> str:
     """
     Fetches the weather report from the OpenWeatherMap API for the given coordinates and time.
+    Forecasts are cached per grid cell until the next update, so follow-up questions about
+    the same area don't download it again.
     """
+    try:
+        match = get_forecast(lat, lon).nearest(time)
+    except ValueError as e:
+        return str(e)
 
-    api_key = os.environ.get("OPENWEATHER_API_KEY")
-    url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&appid={api_key}"
-    response = requests.get(url)
+    main = match["main"]
 
-    if response.status_code == 200:
-        data = response.json()
-        match = min(data["list"], key=lambda x: abs(x["dt"] - int(time)))
-        main = match["main"]
-
-        return (
-            f"Time: {datetime.fromtimestamp(time)}\n"
-            f"Temperature: {main['temp']}°C\n"
-            f"Humidity: {main['humidity']}%\n"
-            f"Description: {match['weather'][0]['description'].capitalize()}"
-        )
-    else:
-        return f"Failed to retrieve weather data: {response.status_code}"
+    return (
+        f"Time: {datetime.fromtimestamp(time)}\n"
+        f"Temperature: {main['temp']}°C\n"
+        f"Humidity: {main['humidity']}%\n"
+        f"Description: {match['weather'][0]['description'].capitalize()}"
+    )
 
 
 def web_text(url: str):
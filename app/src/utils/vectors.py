@@ -0,0 +1,257 @@
+import os
+import re
+import zlib
+import threading
+import numpy as np
+
+from typing import Optional
+
+from src.utils.database import MemoryStore, RECALL_CANDIDATES
+
+
+VECTOR_DIM = 512
+SNIPPET_CHARS = 200
+
+
+class HashingVectorizer:
+    """
+    The HashingVectorizer class turns texts into fixed-size, L2-normalized vectors without
+    a vocabulary. Words, word bigrams and character trigrams are hashed with CRC32, which is
+    stable across runs, into `dim` signed buckets, weighted by log term frequency.
+    The trigrams let inflected forms ('meeting', 'meetings') share most of their features.
+
+    Attributes
+    ----------
+        dim: int
+            The number of dimensions of the vectors
+
+    Methods
+    -------
+        transform(texts: list[str])
+            Return a (len(texts), dim) float32 matrix
+    """
+
+    def __init__(self, dim: int = VECTOR_DIM) -> None:
+        self.dim = dim
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        bigrams = [f"{a} {b}" for a, b in zip(words, words[1:])]
+        trigrams = [
+            f"#{word[i:i + 3]}" for word in words if len(word) > 3 for i in range(len(word) - 2)
+        ]
+        return words + bigrams + trigrams
+
+    def transform(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                # The top bit picks the sign, so collisions tend to cancel out
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+
+        return matrix / norms
+
+
+class MemoryVectorIndex:
+    """
+    The MemoryVectorIndex class is a local semantic index over the memory rows.
+    Vectors are stored as a raw float32 matrix, read through a memory map, with the row ids
+    in a parallel int64 file. New rows are appended to both files, so updates are incremental.
+
+    Attributes
+    ----------
+        path: str
+            The path of the vector file; the ids are stored in `path + '.ids'`
+        vectorizer: HashingVectorizer
+            The vectorizer used for rows and queries
+
+    Methods
+    -------
+        sync(memory: MemoryStore)
+            Append vectors for the rows written since the last sync
+        search(query: str, k: int)
+            Return the k (id, cosine similarity) pairs closest to the query
+    """
+
+    def __init__(self, path: str, dim: int = VECTOR_DIM) -> None:
+        self.path = path
+        self.ids_path = path + ".ids"
+        self.vectorizer = HashingVectorizer(dim)
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.memmap] = None
+        self._ids: Optional[np.memmap] = None
+
+        # Files written with another dimension, or by an interrupted append, are rebuilt
+        rows = self._file_rows()
+        if rows is None:
+            for stale in (self.path, self.ids_path):
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+    def _file_rows(self) -> Optional[int]:
+        if not os.path.exists(self.path) or not os.path.exists(self.ids_path):
+            return 0
+
+        vec_bytes = os.path.getsize(self.path)
+        ids_bytes = os.path.getsize(self.ids_path)
+        row_bytes = self.vectorizer.dim * 4
+
+        if vec_bytes % row_bytes or vec_bytes // row_bytes != ids_bytes // 8:
+            return None
+
+        return ids_bytes // 8
+
+    def _open(self) -> None:
+        rows = self._file_rows() or 0
+
+        if rows == 0:
+            self._matrix, self._ids = None, None
+            return
+
+        self._matrix = np.memmap(
+            self.path, dtype=np.float32, mode="r", shape=(rows, self.vectorizer.dim)
+        )
+        self._ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+
+    def last_id(self) -> int:
+        # Reopened when the files changed underneath, e.g. after the memory was wiped
+        if self._ids is None or len(self._ids) != self._file_rows():
+            self._open()
+        return int(self._ids[-1]) if self._ids is not None else 0
+
+    def sync(self, memory: MemoryStore, batch_size: int = 512) -> int:
+        with self._lock:
+            cur = memory.rows(after_id=self.last_id())
+            added = 0
+
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+
+                vectors = self.vectorizer.transform([row[5] for row in rows])
+                ids = np.array([row[0] for row in rows], dtype=np.int64)
+
+                # Vectors are appended before ids; a partial write is caught by _file_rows
+                with open(self.path, "ab") as f:
+                    f.write(vectors.tobytes())
+                with open(self.ids_path, "ab") as f:
+                    f.write(ids.tobytes())
+
+                added += len(rows)
+
+            if added:
+                self._open()
+
+            return added
+
+    def search(self, query: str, k: int = 5) -> list[tuple[int, float]]:
+        if self._matrix is None:
+            self._open()
+        if self._matrix is None:
+            return []
+
+        q = self.vectorizer.transform([query])[0]
+        # Rows and query are normalized, so the dot product is the cosine similarity
+        scores = self._matrix @ q
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [(int(self._ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+_indexes: dict[str, MemoryVectorIndex] = {}
+
+
+def get_vector_index(memory: MemoryStore) -> MemoryVectorIndex:
+    """
+    Returns the vector index stored next to the memory database, creating it on first use.
+    """
+    path = os.path.splitext(memory.path)[0] + ".vec"
+
+    if path not in _indexes:
+        _indexes[path] = MemoryVectorIndex(path)
+
+    return _indexes[path]
+
+
+def semantic_search(
+    memory: MemoryStore, query: str, limit: int = 5, since: Optional[int] = None
+) -> list[dict]:
+    """
+    Searches the memory by meaning with the local vector index, after appending any new rows.
+    Returns results shaped like MemoryStore.search, with the start of the message as snippet.
+    Ids removed from the memory since they were indexed, e.g. by compaction, are skipped.
+    The summaries of compacted rows are searched too, with the role 'summary'.
+    """
+    index = get_vector_index(memory)
+    index.sync(memory)
+
+    con = memory.connection()
+    k = limit * RECALL_CANDIDATES
+
+    # The index knows nothing of time, so when `since` filters out too many of the top
+    # candidates, more are fetched until enough pass or the matches run out
+    while True:
+        hits = dict(index.search(query, k=k))
+        rows = []
+
+        if hits:
+            placeholders = ", ".join("?" * len(hits))
+            rows = con.execute(
+                "SELECT id, thread_id, role, time, message FROM memory "
+                f"WHERE id IN ({placeholders}) AND time >= ?",
+                (*hits, since or 0),
+            ).fetchall()
+
+        if len(rows) >= limit * RECALL_CANDIDATES or len(hits) < k:
+            break
+
+        k *= 4
+
+    results = [
+        {
+            "id": row_id,
+            "thread_id": thread_id,
+            "role": role,
+            "time": time_ms,
+            "snippet": message if len(message) <= SNIPPET_CHARS else message[:SNIPPET_CHARS] + "...",
+            "score": hits[row_id],
+        }
+        for row_id, thread_id, role, time_ms, message in rows
+    ]
+
+    # There is at most one summary per thread and day, so they are scored on the fly
+    summaries = con.execute(
+        "SELECT id, thread_id, last_time, summary FROM memory_summaries WHERE last_time >= ?",
+        (since or 0,),
+    ).fetchall()
+
+    if summaries:
+        vectorizer = index.vectorizer
+        scores = vectorizer.transform([row[3] for row in summaries]) @ vectorizer.transform([query])[0]
+        results += [
+            {
+                "id": row_id,
+                "thread_id": thread_id,
+                "role": "summary",
+                "time": time_ms,
+                "snippet": summary if len(summary) <= SNIPPET_CHARS else summary[:SNIPPET_CHARS] + "...",
+                "score": float(score),
+            }
+            for (row_id, thread_id, time_ms, summary), score in zip(summaries, scores)
+            if score > 0
+        ]
+
+    results.sort(key=lambda result: result["score"], reverse=True)
+
+    return results[:limit]
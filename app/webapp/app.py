@@ -2,6 +2,8 @@ from quart import Quart, render_template, request, current_app
 from werkzeug.utils import secure_filename
 from src.agent.agent import Assistant
 from src.ais.assistant import upload_file_by_name
+from src.utils.content_store import ContentStore
+from src.utils.file_registry import get_file_registry
 from pathlib import Path
 import asyncio
 import os
@@ -11,6 +13,8 @@ app = Quart(__name__)
 DEFAULT_DIR = "agent"
 SAVE_DIRECTORY = r"app/files/documents"
 
+content_store = ContentStore()
+
 
 @app.route("/")
 async def home():
@@ -24,6 +28,11 @@ async def initialize_agent():
     app.conv = await current_app.assistant.load_or_create_conv(False)
 
 
+@app.after_serving
+async def shutdown_agent():
+    await current_app.assistant.close()
+
+
 @app.route("/chat", methods=["POST"])
 async def chat():
     if request.method == "POST":
@@ -42,9 +51,21 @@ async def upload_file():
     if request.method == "POST":
         form_files = await request.files
         f = form_files["the_file"]
-        file_path = os.path.join(SAVE_DIRECTORY, secure_filename(f.filename))
-        await f.save(file_path)
-        await upload_file_by_name(current_app.assistant.oac, current_app.assistant.asst_id, Path(file_path), force=True)
+        file_name = secure_filename(f.filename)
+        asst_id = current_app.assistant.asst_id
+
+        # Stored once per content, and exposed under its name in the documents directory
+        sha256 = await asyncio.to_thread(content_store.put, f.stream)
+        file_path = await asyncio.to_thread(
+            content_store.link, sha256, Path(SAVE_DIRECTORY, file_name)
+        )
+
+        known = get_file_registry().by_hash(asst_id, sha256)
+        if known is not None:
+            get_file_registry().add_alias(asst_id, file_name, known["file_id"])
+            return f"File already uploaded as '{known['name']}'", 200
+
+        await upload_file_by_name(current_app.assistant.oac, asst_id, file_path, force=True)
 
         return "File uploaded successfully", 200
 